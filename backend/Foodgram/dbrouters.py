@@ -0,0 +1,174 @@
+import hashlib
+import threading
+from itertools import count
+from time import monotonic, time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+STICKY_CACHE_ALIAS = 'sticky'
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.dummy.DummyCache',
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+LAG_QUERY = (
+    'SELECT EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())'
+)
+
+state = threading.local()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+def client_address(request):
+    """Адрес клиента из заголовка доверенного прокси REPLICA_CLIENT_IP_HEADER.
+
+    За nginx REMOTE_ADDR у всех клиентов один и тот же, поэтому он берётся
+    только без прокси. В X-Forwarded-For клиент может дописать что угодно
+    слева, так что берётся последний адрес — его добавил сам прокси.
+    """
+    header = settings.REPLICA_CLIENT_IP_HEADER
+    address = request.META.get(header, '') if header else ''
+    return address.split(',')[-1].strip() or request.META.get(
+        'REMOTE_ADDR', ''
+    )
+
+
+def digest(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def writer_key(request):
+    """Ключ того, кто пишет: токен, сессия или, у анонимных, адрес."""
+    authorization = request.META.get('HTTP_AUTHORIZATION')
+    if authorization:
+        return 'sticky:auth:' + digest(authorization)
+    session = request.COOKIES.get(settings.SESSION_COOKIE_NAME)
+    if session:
+        return 'sticky:session:' + digest(session)
+    return 'sticky:ip:' + client_address(request)
+
+
+def is_sticky(request):
+    """Писал ли клиент недавно. Адрес проверяется и у вошедших: вход
+    и регистрация — анонимная запись, после которой приходят уже
+    с токеном, которого на реплике может ещё не быть.
+    """
+    return bool(caches[STICKY_CACHE_ALIAS].get_many({
+        writer_key(request), 'sticky:ip:' + client_address(request)
+    }))
+
+
+def check_sticky_cache():
+    """Привязка к основной базе должна быть видна всем процессам:
+    иначе запрос после записи, попавший в другой процесс, прочитает
+    реплику и не увидит изменений.
+    """
+    backend = settings.CACHES[STICKY_CACHE_ALIAS]['BACKEND']
+    if backend in PROCESS_LOCAL_CACHES:
+        raise ImproperlyConfigured(
+            f'С репликами кэш {STICKY_CACHE_ALIAS} должен быть общим '
+            f'для всех процессов, а не {backend}.'
+        )
+
+
+def mark_sticky(request):
+    caches[STICKY_CACHE_ALIAS].set(
+        writer_key(request), True, settings.REPLICA_STICKY_SECONDS
+    )
+
+
+def may_read_stale(changed_at):
+    """Читал ли текущий запрос с реплики, которая могла ещё не получить
+    изменения, сделанные в changed_at (timestamp): реплике даётся столько
+    же времени, сколько клиент после записи читает с основной базы.
+    """
+    return (
+        getattr(state, 'read_replica', False)
+        and time() - changed_at < settings.REPLICA_STICKY_SECONDS
+    )
+
+
+class ReplicaSelector:
+    """Выбирает реплику по кругу или с наименьшим отставанием.
+
+    Отставание реплик PostgreSQL проверяется не чаще, чем раз
+    в REPLICA_LAG_CHECK_INTERVAL секунд; реплики, отстающие больше
+    REPLICA_MAX_LAG, не используются. Для других баз отставание
+    считается нулевым.
+    """
+
+    def __init__(self):
+        self._counter = count()
+        self._lock = threading.Lock()
+        self._lags = {}
+        self._checked_at = None
+
+    def choose(self):
+        aliases = replica_aliases()
+        if not aliases:
+            return DEFAULT_DB_ALIAS
+        if settings.REPLICA_SELECTION != 'lag':
+            return aliases[next(self._counter) % len(aliases)]
+        lags = self.get_lags(aliases)
+        fresh = [
+            alias for alias in aliases
+            if lags.get(alias) is not None
+            and lags[alias] <= settings.REPLICA_MAX_LAG
+        ]
+        if not fresh:
+            return DEFAULT_DB_ALIAS
+        return min(fresh, key=lags.get)
+
+    def get_lags(self, aliases):
+        with self._lock:
+            now = monotonic()
+            if (self._checked_at is None or now - self._checked_at
+                    > settings.REPLICA_LAG_CHECK_INTERVAL):
+                self._lags = {alias: self.measure(alias) for alias in aliases}
+                self._checked_at = now
+            return self._lags
+
+    def measure(self, alias):
+        connection = connections[alias]
+        if connection.vendor != 'postgresql':
+            return 0
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(LAG_QUERY)
+                lag = cursor.fetchone()[0]
+        except DatabaseError:
+            return None
+        return float(lag or 0)
+
+
+selector = ReplicaSelector()
+
+
+class ReplicaRouter:
+    """Чтения безопасных запросов — на реплики, всё остальное — в default.
+
+    На реплику чтение уходит, только если ReplicaMiddleware разрешил это
+    для текущего запроса и в нём ещё не было записи; вне запросов
+    (команды, shell, обработчики задач) используется основная база.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(state, 'use_replica', False):
+            state.read_replica = state.replica != DEFAULT_DB_ALIAS
+            return state.replica
+        return DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        state.use_replica = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == DEFAULT_DB_ALIAS
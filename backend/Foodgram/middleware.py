@@ -0,0 +1,188 @@
+import json
+import logging
+import os
+import random
+import re
+import sys
+from collections import defaultdict
+from contextlib import ExitStack
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+from . import dbrouters
+
+logger = logging.getLogger('foodgram.profiling')
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+IN_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+NUMBER = re.compile(r'\b\d+\b')
+STRING = re.compile(r"'(?:[^']|'')*'")
+MAX_SQL_LENGTH = 300
+MAX_DUPLICATES = 10
+
+
+def normalize_sql(sql):
+    """SQL без конкретных значений, чтобы одинаковые запросы совпадали."""
+    sql = STRING.sub('?', sql)
+    sql = NUMBER.sub('?', sql)
+    return IN_LIST.sub('(...)', sql)
+
+
+def find_caller():
+    """Ближайшая функция проекта в стеке, из которой пришёл запрос."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        path = frame.f_code.co_filename
+        if (path.startswith(settings.BASE_DIR) and path != __file__
+                and 'site-packages' not in path):
+            return '{}:{}'.format(
+                os.path.relpath(path, settings.BASE_DIR),
+                frame.f_code.co_name
+            )
+        frame = frame.f_back
+    return None
+
+
+class QueryRecorder:
+    """Обёртка connection.execute_wrapper: время и источник запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.statements = defaultdict(lambda: {'count': 0, 'callers': set()})
+
+    def __call__(self, execute, sql, params, many, context):
+        start = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - start
+            self.count += 1
+            statement = self.statements[normalize_sql(sql)]
+            statement['count'] += 1
+            caller = find_caller()
+            if caller:
+                statement['callers'].add(caller)
+
+    def duplicates(self):
+        repeated = sorted(
+            (
+                (statement['count'], sql, sorted(statement['callers']))
+                for sql, statement in self.statements.items()
+                if statement['count'] > 1
+            ),
+            reverse=True
+        )
+        return [
+            {'sql': sql[:MAX_SQL_LENGTH], 'count': count, 'callers': callers}
+            for count, sql, callers in repeated[:MAX_DUPLICATES]
+        ]
+
+
+class ProfilingMiddleware:
+    """Профилирует случайную долю запросов (PROFILING_SAMPLE_RATE).
+
+    Для выбранных запросов добавляет заголовок Server-Timing с временем
+    запросов к базе, кода приложения (view без запросов к базе: разбор
+    запроса, права, сериализация), рендеринга и общим временем и пишет
+    в лог foodgram.profiling строку JSON с числом запросов и повторами.
+    При нулевой доле middleware отключается целиком.
+    """
+
+    def __init__(self, get_response):
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        if self.sample_rate <= 0:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        recorder = QueryRecorder()
+        timings = {}
+        request._profiling_timings = timings
+        start = perf_counter()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        total = perf_counter() - start
+        view_end = timings.get('view_end', start + total)
+        render = timings.get('render_end', view_end) - view_end
+        app = max(view_end - start - recorder.duration, 0)
+        metrics = {
+            'db': recorder.duration,
+            'app': app,
+            'render': render,
+            'total': total,
+        }
+        descriptions = {
+            'db': f'{recorder.count} queries',
+            'app': 'view without db',
+        }
+        response['Server-Timing'] = ', '.join(
+            '{};dur={:.1f}{}'.format(
+                name, value * 1000,
+                f';desc="{descriptions[name]}"' if name in descriptions
+                else ''
+            )
+            for name, value in metrics.items()
+        )
+        logger.info(json.dumps({
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            **{
+                f'{name}_ms': round(value * 1000, 1)
+                for name, value in metrics.items()
+            },
+            'duplicates': recorder.duplicates(),
+        }, ensure_ascii=False))
+        return response
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, '_profiling_timings', None)
+        if timings is not None:
+            timings['view_end'] = perf_counter()
+            response.add_post_render_callback(
+                lambda rendered: timings.update(render_end=perf_counter())
+            )
+        return response
+
+
+class ReplicaMiddleware:
+    """Разрешает ReplicaRouter читать с реплик в безопасных запросах.
+
+    После небезопасного запроса клиент на REPLICA_STICKY_SECONDS
+    закрепляется за основной базой, чтобы сразу видеть свои изменения.
+    Без настроенных реплик middleware отключается, а с репликами
+    требует общего для процессов кэша привязки.
+    """
+
+    def __init__(self, get_response):
+        if not dbrouters.replica_aliases():
+            raise MiddlewareNotUsed
+        dbrouters.check_sticky_cache()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        safe = request.method in SAFE_METHODS
+        dbrouters.state.use_replica = safe and not dbrouters.is_sticky(
+            request
+        )
+        dbrouters.state.read_replica = False
+        if dbrouters.state.use_replica:
+            dbrouters.state.replica = dbrouters.selector.choose()
+        try:
+            response = self.get_response(request)
+        finally:
+            dbrouters.state.use_replica = False
+            dbrouters.state.read_replica = False
+        if not safe:
+            dbrouters.mark_sticky(request)
+        return response
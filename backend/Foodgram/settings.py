@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -40,12 +41,16 @@ INSTALLED_APPS = [
     'djoser',
     'django_filters',
     'colorfield',
+    'sorl.thumbnail',
     'api',
     'recipes',
+    'tasks',
     'users',
 ]
 
 MIDDLEWARE = [
+    'Foodgram.middleware.ProfilingMiddleware',
+    'Foodgram.middleware.ReplicaMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -87,6 +92,90 @@ DATABASES = {
     }
 }
 
+REPLICA_FIELD = (
+    'NAME' if DATABASES['default']['ENGINE'].endswith('sqlite3') else 'HOST'
+)
+for number, replica in enumerate(
+    filter(None, os.getenv('DB_REPLICAS', default='').split(',')), start=1
+):
+    DATABASES[f'replica{number}'] = {
+        **DATABASES['default'],
+        REPLICA_FIELD: replica.strip(),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['Foodgram.dbrouters.ReplicaRouter']
+REPLICA_SELECTION = os.getenv('REPLICA_SELECTION', default='round_robin')
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', default=10))
+REPLICA_CLIENT_IP_HEADER = os.getenv(
+    'REPLICA_CLIENT_IP_HEADER', default='HTTP_X_REAL_IP'
+)
+REPLICA_MAX_LAG = float(os.getenv('REPLICA_MAX_LAG', default=5))
+REPLICA_LAG_CHECK_INTERVAL = float(
+    os.getenv('REPLICA_LAG_CHECK_INTERVAL', default=5)
+)
+
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.getenv(
+            'RESPONSE_CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('RESPONSE_CACHE_LOCATION', default='responses'),
+        'TIMEOUT': int(os.getenv('RESPONSE_CACHE_TIMEOUT', default=300)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('RESPONSE_CACHE_MAX_ENTRIES', default=1000)
+            ),
+        },
+    },
+    'generations': {
+        'BACKEND': os.getenv(
+            'GENERATION_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'GENERATION_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_generations')
+        ),
+        'TIMEOUT': None,
+    },
+    'sticky': {
+        'BACKEND': os.getenv(
+            'STICKY_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'STICKY_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_sticky')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('STICKY_CACHE_MAX_ENTRIES', default=100000)
+            ),
+        },
+    },
+    'throttle': {
+        'BACKEND': os.getenv(
+            'THROTTLE_CACHE_BACKEND',
+            default='django.core.cache.backends.filebased.FileBasedCache'
+        ),
+        'LOCATION': os.getenv(
+            'THROTTLE_CACHE_LOCATION',
+            default=os.path.join(tempfile.gettempdir(), 'foodgram_throttle')
+        ),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(
+                os.getenv('THROTTLE_CACHE_MAX_ENTRIES', default=100000)
+            ),
+        },
+    },
+}
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -123,14 +212,95 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+SHOPPING_LIST_FONT = os.getenv(
+    'SHOPPING_LIST_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
+THUMBNAIL_PRESERVE_FORMAT = False
+
+RECIPE_IMAGE_VARIANTS = {
+    'thumb': '100x100',
+    'medium': '480x320',
+}
+RECIPE_IMAGE_FORMATS = ('WEBP', 'JPEG')
+RECIPE_IMAGE_QUALITY = 85
+
+RECIPE_SEARCH_CONFIG = os.getenv('RECIPE_SEARCH_CONFIG', default='russian')
+
+IMPORT_MAX_ROWS = int(os.getenv('IMPORT_MAX_ROWS', default=1000))
+IMPORT_MAX_BYTES = int(
+    os.getenv('IMPORT_MAX_BYTES', default=50 * 1024 * 1024)
+)
+
+FEED_PUSH_MAX_SUBSCRIBERS = int(
+    os.getenv('FEED_PUSH_MAX_SUBSCRIBERS', default=10000)
+)
+FEED_BACKFILL_SIZE = int(os.getenv('FEED_BACKFILL_SIZE', default=100))
+FEED_MAX_LENGTH = int(os.getenv('FEED_MAX_LENGTH', default=1000))
+FEED_BATCH_SIZE = 1000
+
+SIMILAR_RECIPES_COUNT = int(os.getenv('SIMILAR_RECIPES_COUNT', default=10))
+SIMILAR_RECIPES_TAG_BOOST = float(
+    os.getenv('SIMILAR_RECIPES_TAG_BOOST', default=0.2)
+)
+SIMILAR_RECIPES_BATCH_SIZE = 500
+
+TASKS_EAGER = os.getenv('TASKS_EAGER', default='False') == 'True'
+TASK_MAX_ATTEMPTS = int(os.getenv('TASK_MAX_ATTEMPTS', default=5))
+TASK_RETRY_DELAY = int(os.getenv('TASK_RETRY_DELAY', default=10))
+TASK_RETRY_MAX_DELAY = int(os.getenv('TASK_RETRY_MAX_DELAY', default=3600))
+TASK_RUNNING_TIMEOUT = int(os.getenv('TASK_RUNNING_TIMEOUT', default=1800))
+TASK_KEEP_DONE = int(os.getenv('TASK_KEEP_DONE', default=7 * 24 * 3600))
+
+AUTH_TOKEN_CACHE_TIMEOUT = int(
+    os.getenv('AUTH_TOKEN_CACHE_TIMEOUT', default=300)
+)
+AUTH_TOKEN_CACHE_MAX_SIZE = int(
+    os.getenv('AUTH_TOKEN_CACHE_MAX_SIZE', default=10000)
+)
+AUTH_TOKEN_CACHE_ALIAS = os.getenv('AUTH_TOKEN_CACHE_ALIAS')
+
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', default=0))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'foodgram.profiling': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        'foodgram.tasks': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 
 REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ],
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework.authentication.TokenAuthentication',
+        'api.authentication.CachedTokenAuthentication',
     ),
+    'DEFAULT_THROTTLE_RATES': {
+        'favorite': os.getenv('FAVORITE_THROTTLE_RATE', default='30/min'),
+        'shopping_cart': os.getenv(
+            'SHOPPING_CART_THROTTLE_RATE', default='30/min'
+        ),
+        'subscribe': os.getenv('SUBSCRIBE_THROTTLE_RATE', default='20/min'),
+        'import': os.getenv('IMPORT_THROTTLE_RATE', default='10/hour'),
+    },
 }
 
 
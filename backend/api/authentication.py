@@ -0,0 +1,106 @@
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from time import monotonic
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.translation import gettext_lazy as _
+from recipes.generations import get_generations
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class TokenCache:
+    """LRU-кэш токенов процесса, ограниченный по размеру и времени жизни.
+
+    Каждая запись помнит поколение auth, при котором была загружена,
+    и перестаёт действовать, как только поколение меняется.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def get(self, key, generation):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, entry_generation, token = entry
+            if expires < monotonic() or entry_generation != generation:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return token
+
+    def set(self, key, generation, token):
+        with self._lock:
+            self._entries[key] = (
+                monotonic() + settings.AUTH_TOKEN_CACHE_TIMEOUT,
+                generation,
+                token
+            )
+            self._entries.move_to_end(key)
+            while len(self._entries) > settings.AUTH_TOKEN_CACHE_MAX_SIZE:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+local_tokens = TokenCache()
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """TokenAuthentication без запроса к базе, пока токен есть в кэше.
+
+    Токен ищется в кэше процесса, затем в общем кэше
+    AUTH_TOKEN_CACHE_ALIAS, если он задан, и только потом в базе.
+    Выход, смена пароля и деактивация пользователя меняют поколение
+    auth, после чего все закэшированные токены проверяются заново.
+    """
+
+    def authenticate_credentials(self, key):
+        generation, = get_generations('auth')
+        token = local_tokens.get(key, generation)
+        if token is None:
+            token = self.get_shared(key, generation)
+            if token is None:
+                token = self.load_token(key)
+                self.set_shared(key, generation, token)
+            local_tokens.set(key, generation, token)
+        if not token.user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return copy.copy(token.user), token
+
+    def load_token(self, key):
+        try:
+            return self.get_model().objects.select_related('user').get(
+                key=key
+            )
+        except self.get_model().DoesNotExist:
+            raise AuthenticationFailed(_('Invalid token.'))
+
+    def shared_key(self, key):
+        return 'auth-token:' + hashlib.sha256(key.encode()).hexdigest()
+
+    def get_shared(self, key, generation):
+        if not settings.AUTH_TOKEN_CACHE_ALIAS:
+            return None
+        entry = caches[settings.AUTH_TOKEN_CACHE_ALIAS].get(
+            self.shared_key(key)
+        )
+        if entry is None or entry[0] != generation:
+            return None
+        return entry[1]
+
+    def set_shared(self, key, generation, token):
+        if settings.AUTH_TOKEN_CACHE_ALIAS:
+            caches[settings.AUTH_TOKEN_CACHE_ALIAS].set(
+                self.shared_key(key),
+                (generation, token),
+                settings.AUTH_TOKEN_CACHE_TIMEOUT
+            )
@@ -1,12 +1,68 @@
+from django.db.models import BooleanField, Exists, Lookup, OuterRef
 from django_filters import (ChoiceFilter, FilterSet, ModelChoiceFilter,
                             ModelMultipleChoiceFilter)
-from recipes.models import Recipe, Tag, User
-from rest_framework.filters import SearchFilter
+from recipes.models import Favorite, Recipe, ShoppingCart, Tag, User
+from recipes.search import ingredient_index, search_recipes
+from rest_framework.filters import BaseFilterBackend
 
 
-class IngredientSearchFilter(SearchFilter):
+class IngredientSearchFilter(BaseFilterBackend):
     search_param = 'name'
 
+    def filter_queryset(self, request, queryset, view):
+        name = request.query_params.get(self.search_param)
+        if not name:
+            return queryset
+        return ingredient_index.search(name)
+
+
+class RecipeSearchFilter(BaseFilterBackend):
+    """Полнотекстовый поиск по названию, ингредиентам и описанию.
+
+    Без явного ?ordering результаты сортируются по релевантности.
+    """
+
+    search_param = 'search'
+    ordering_param = 'ordering'
+
+    def filter_queryset(self, request, queryset, view):
+        text = request.query_params.get(self.search_param, '').strip()
+        if not text:
+            return queryset
+        queryset = search_recipes(queryset, text)
+        if self.ordering_param in request.query_params:
+            return queryset
+        return queryset.order_by('-search_rank', '-id')
+
+
+@BooleanField.register_lookup
+class Holds(Lookup):
+    """Условие field__holds=True без сравнения с TRUE.
+
+    filter(exists=True) в Django 2.2 превращается в EXISTS(...) = true,
+    и PostgreSQL выполняет такой подзапрос для каждой строки; голый
+    EXISTS планировщик разворачивает в semi join по индексам.
+    """
+
+    lookup_name = 'holds'
+    prepare_rhs = False
+
+    def as_sql(self, compiler, connection):
+        sql, params = self.process_lhs(compiler, connection)
+        return (sql if self.rhs else f'NOT ({sql})'), params
+
+
+def filter_exists(queryset, name, subquery):
+    """Оставляет рецепты, для которых subquery не пуст.
+
+    Условие записывается как коррелированный EXISTS, а не JOIN, поэтому
+    строки не размножаются; если queryset уже аннотирован под именем
+    name (with_user_flags), подзапрос не повторяется.
+    """
+    if name not in queryset.query.annotations:
+        queryset = queryset.annotate(**{name: Exists(subquery)})
+    return queryset.filter(**{f'{name}__holds': True})
+
 
 class RecipeFilter(FilterSet):
     is_favorited = ChoiceFilter(
@@ -21,7 +77,8 @@ class RecipeFilter(FilterSet):
     tags = ModelMultipleChoiceFilter(
         field_name='tags__slug',
         to_field_name='slug',
-        queryset=Tag.objects.all()
+        queryset=Tag.objects.all(),
+        method='filter_tags'
     )
 
     class Meta:
@@ -30,10 +87,27 @@ class RecipeFilter(FilterSet):
 
     def filter_is_favorited(self, queryset, name, value):
         if int(value) == 1 and not self.request.user.is_anonymous:
-            return queryset.filter(favorites__user=self.request.user)
+            return filter_exists(
+                queryset, 'is_favorited', Favorite.objects.filter(
+                    user=self.request.user, recipe=OuterRef('pk')
+                )
+            )
         return queryset
 
     def filter_is_in_shopping_cart(self, queryset, name, value):
         if int(value) == 1 and not self.request.user.is_anonymous:
-            return queryset.filter(shopping_cart__user=self.request.user)
+            return filter_exists(
+                queryset, 'is_in_shopping_cart', ShoppingCart.objects.filter(
+                    user=self.request.user, recipe=OuterRef('pk')
+                )
+            )
         return queryset
+
+    def filter_tags(self, queryset, name, value):
+        if not value:
+            return queryset
+        return filter_exists(
+            queryset, 'has_tags', Recipe.tags.through.objects.filter(
+                recipe=OuterRef('pk'), tag__in=[tag.pk for tag in value]
+            )
+        )
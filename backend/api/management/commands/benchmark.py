@@ -0,0 +1,252 @@
+import json
+import math
+import platform
+import tracemalloc
+from contextlib import ExitStack
+from time import perf_counter
+
+import django
+from api.throttling import CACHE_ALIAS, TokenBucketThrottle
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from recipes.models import Recipe, ShoppingCart
+from rest_framework.authtoken.models import Token
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+from users.models import User
+
+ENDPOINTS = (
+    ('recipes', '/api/recipes/?limit=6', True),
+    ('recipes_anonymous', '/api/recipes/?limit=6', False),
+    (
+        'recipes_sparse',
+        '/api/recipes/?limit=6&fields=id,name,image_thumb,cooking_time',
+        True
+    ),
+    (
+        'recipes_filtered',
+        '/api/recipes/?limit=6&is_favorited=1&tags=breakfast&tags=lunch',
+        True
+    ),
+    ('recipes_author', '/api/recipes/?limit=6&author={author}', False),
+    ('recipe', '/api/recipes/{recipe}/', True),
+    ('recipe_similar', '/api/recipes/{recipe}/similar/', False),
+    ('feed', '/api/recipes/feed/?limit=6', True),
+    (
+        'subscriptions',
+        '/api/users/subscriptions/?limit=6&recipes_limit=3',
+        True
+    ),
+    (
+        'download_shopping_cart',
+        '/api/recipes/download_shopping_cart/?format=txt',
+        True
+    ),
+    ('shopping_cart', '/api/recipes/shopping_cart/', True),
+    ('ingredients_search', '/api/ingredients/?name={search}', False),
+)
+THROTTLE_SCOPE = 'favorite'
+PERCENTILES = (50, 95, 99)
+COMPARED = ('p50_ms', 'p95_ms', 'p99_ms', 'queries', 'peak_kb')
+
+
+def percentile(values, rank):
+    ordered = sorted(values)
+    return ordered[max(math.ceil(rank / 100 * len(ordered)) - 1, 0)]
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure latency, queries and peak memory of hot API endpoints '
+        'through the test client. Run it on SQLite with data from '
+        'seed_data to get comparable numbers.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--username',
+            help='Пользователь для запросов с токеном; по умолчанию тот, '
+                 'у кого больше всего подписок.'
+        )
+        parser.add_argument('--search', default='са')
+        parser.add_argument(
+            '--only', nargs='+', choices=[name for name, _, _ in ENDPOINTS],
+            help='Замерить только указанные эндпоинты.'
+        )
+        parser.add_argument('--output', help='Файл для результатов в JSON.')
+        parser.add_argument(
+            '--compare',
+            help='JSON прошлого запуска, с которым сравнить результаты.'
+        )
+
+    def handle(self, *args, **options):
+        if options['iterations'] < 1:
+            raise CommandError('--iterations должен быть больше 0.')
+        user = self.get_user(options['username'])
+        client = Client()
+        results = {
+            name: self.measure(
+                client, url, headers,
+                options['iterations'], options['warmup']
+            )
+            for name, url, headers in self.get_endpoints(user, options)
+        }
+        report = {
+            'meta': {
+                'database': connection.vendor,
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'iterations': options['iterations'],
+                'users': User.objects.count(),
+                'recipes': Recipe.objects.count(),
+                'username': user.username,
+                'cart_recipes': ShoppingCart.objects.filter(
+                    user=user
+                ).count(),
+            },
+            'endpoints': results,
+            'throttle': self.measure_throttle(options['iterations'] * 20),
+        }
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as output:
+                output.write(data)
+        else:
+            self.stdout.write(data)
+        if options['compare']:
+            self.compare(report, options['compare'])
+
+    def get_endpoints(self, user, options):
+        """Эндпоинты из ENDPOINTS с подставленными параметрами:
+        список (имя, url, заголовки).
+        """
+        recipe = Recipe.objects.order_by('-favorites_count').first()
+        if recipe is None:
+            raise CommandError('В базе нет рецептов, запустите seed_data.')
+        token, _ = Token.objects.get_or_create(user=user)
+        headers = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        return [
+            (
+                name,
+                url.format(
+                    recipe=recipe.pk, author=recipe.author_id,
+                    search=options['search']
+                ),
+                headers if authenticated else {}
+            )
+            for name, url, authenticated in ENDPOINTS
+            if not options['only'] or name in options['only']
+        ]
+
+    def get_user(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'Пользователь {username} не найден.')
+        user = User.objects.annotate(
+            subscriptions_total=Count('subscribers')
+        ).order_by('-subscriptions_total', 'pk').first()
+        if user is None:
+            raise CommandError(
+                'В базе нет пользователей, запустите seed_data.'
+            )
+        return user
+
+    def request(self, client, url, headers):
+        response = client.get(url, **headers)
+        if response.status_code != 200:
+            raise CommandError(f'{url}: статус {response.status_code}.')
+        if response.streaming:
+            return b''.join(response.streaming_content)
+        return response.content
+
+    def measure(self, client, url, headers, iterations, warmup):
+        for _ in range(warmup):
+            self.request(client, url, headers)
+        durations, queries = [], []
+        for _ in range(iterations):
+            counter = QueryCounter()
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(counter)
+                    )
+                start = perf_counter()
+                self.request(client, url, headers)
+                durations.append((perf_counter() - start) * 1000)
+            queries.append(counter.count)
+        tracemalloc.start()
+        try:
+            self.request(client, url, headers)
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        result = {
+            f'p{rank}_ms': round(percentile(durations, rank), 2)
+            for rank in PERCENTILES
+        }
+        result.update(
+            mean_ms=round(sum(durations) / len(durations), 2),
+            queries=max(queries),
+            peak_kb=round(peak / 1024, 1),
+        )
+        return result
+
+    def measure_throttle(self, iterations):
+        """Время одной проверки TokenBucketThrottle для несуществующего
+        пользователя с частотой THROTTLE_SCOPE, включая отказы.
+        """
+        request = Request(APIRequestFactory().post('/'))
+        request.user = User(pk=0)
+        view = type('View', (), {'throttle_scope': THROTTLE_SCOPE})()
+        durations = []
+        for _ in range(iterations):
+            throttle = TokenBucketThrottle()
+            start = perf_counter()
+            throttle.allow_request(request, view)
+            durations.append((perf_counter() - start) * 1000)
+        caches[CACHE_ALIAS].delete(throttle.get_cache_key(request, view))
+        result = {
+            f'p{rank}_ms': round(percentile(durations, rank), 3)
+            for rank in PERCENTILES
+        }
+        result['mean_ms'] = round(sum(durations) / len(durations), 3)
+        return result
+
+    def compare(self, report, path):
+        try:
+            with open(path, encoding='utf-8') as baseline_file:
+                baseline = json.load(baseline_file)
+        except (OSError, ValueError) as error:
+            raise CommandError(error)
+        if baseline['meta'].get('database') != report['meta']['database']:
+            self.stderr.write(
+                'Предупреждение: результаты получены на разных базах.'
+            )
+        for name, result in report['endpoints'].items():
+            before = baseline['endpoints'].get(name)
+            if before is None:
+                continue
+            changes = []
+            for metric in COMPARED:
+                old, new = before.get(metric), result[metric]
+                if old is None:
+                    continue
+                delta = f'{(new - old) / old:+.0%}' if old else 'n/a'
+                changes.append(f'{metric} {old} -> {new} ({delta})')
+            self.stderr.write(f'{name}: ' + ', '.join(changes))
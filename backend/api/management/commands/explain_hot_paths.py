@@ -0,0 +1,147 @@
+import json
+import re
+from contextlib import ExitStack
+
+from django.core.management.base import CommandError
+from django.db import connection, connections
+from django.test import Client
+
+from .benchmark import ENDPOINTS
+from .benchmark import Command as BenchmarkCommand
+
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$')
+SELECTIVE_SHARE = 0.1
+
+
+class StatementRecorder:
+    def __init__(self):
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.statements.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+def plan_nodes(node):
+    yield node
+    for child in node.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+class Command(BenchmarkCommand):
+    help = (
+        'Run EXPLAIN on the queries behind hot API endpoints and fail on '
+        'selective sequential scans of large tables or expensive plans. '
+        'Run it on PostgreSQL with data from seed_data before deploy; '
+        'SQLite gives no estimates, so its full scans are only reported.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-cost', type=float, default=10000,
+            help='Наибольшая допустимая оценка стоимости плана (PostgreSQL).'
+        )
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help='Последовательное чтение таблиц меньше этого размера '
+                 'не считается ошибкой.'
+        )
+        parser.add_argument(
+            '--analyze', action='store_true',
+            help='Обновить статистику таблиц перед EXPLAIN.'
+        )
+        parser.add_argument('--username')
+        parser.add_argument('--search', default='са')
+        parser.add_argument(
+            '--only', nargs='+', choices=[name for name, _, _ in ENDPOINTS]
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.table_sizes = {}
+        self.tables = set(connection.introspection.table_names())
+        if options['analyze']:
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        user = self.get_user(options['username'])
+        client = Client()
+        problems = []
+        for name, url, headers in self.get_endpoints(user, options):
+            self.request(client, url, headers)
+            recorder = StatementRecorder()
+            with ExitStack() as stack:
+                for alias in connections:
+                    stack.enter_context(
+                        connections[alias].execute_wrapper(recorder)
+                    )
+                self.request(client, url, headers)
+            costs = []
+            for sql, params in dict(recorder.statements).items():
+                cost, scans = self.explain(sql, params)
+                costs.append(cost or 0)
+                if cost is not None and cost > options['max_cost']:
+                    problems.append(
+                        f'{name}: стоимость {cost:.0f}: {sql[:200]}'
+                    )
+                for table in scans:
+                    message = (
+                        f'{name}: последовательное чтение {table} '
+                        f'({self.table_size(table)} строк): {sql[:200]}'
+                    )
+                    if cost is None:
+                        self.stdout.write(self.style.WARNING(message))
+                    else:
+                        problems.append(message)
+            self.stdout.write(
+                f'{name}: запросов {len(recorder.statements)}, '
+                f'наибольшая стоимость {max(costs, default=0):.0f}'
+            )
+        if problems:
+            raise CommandError('\n'.join(problems))
+        self.stdout.write(self.style.SUCCESS('Планы запросов в порядке.'))
+
+    def explain(self, sql, params):
+        """Оценка стоимости плана (None, если база её не даёт) и большие
+        таблицы, которые читаются целиком. В PostgreSQL учитываются только
+        чтения с фильтром, оставляющим меньше SELECTIVE_SHARE строк:
+        там, где нужна почти вся таблица, полный проход оправдан.
+        """
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+                plan = cursor.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                root = plan[0]['Plan']
+                cost = root['Total Cost']
+                tables = [
+                    node['Relation Name'] for node in plan_nodes(root)
+                    if node['Node Type'] == 'Seq Scan' and 'Filter' in node
+                    and node['Plan Rows'] < SELECTIVE_SHARE * self.table_size(
+                        node['Relation Name']
+                    )
+                ]
+            else:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+                cost = None
+                tables = [
+                    match.group(1) for match in (
+                        SQLITE_SCAN.match(row[-1])
+                        for row in cursor.fetchall()
+                    ) if match
+                ]
+        return cost, [
+            table for table in tables if table in self.tables
+            and self.table_size(table) >= self.options['min_rows']
+        ]
+
+    def table_size(self, table):
+        if table not in self.table_sizes:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'SELECT COUNT(*) FROM '
+                    + connection.ops.quote_name(table)
+                )
+                self.table_sizes[table] = cursor.fetchone()[0]
+        return self.table_sizes[table]
@@ -0,0 +1,134 @@
+import hashlib
+
+from django.core.cache import caches
+from django.utils.cache import (get_conditional_response,
+                                patch_vary_headers)
+from django.utils.http import http_date
+from Foodgram import dbrouters
+from recipes.generations import get_generations, viewer_generation
+from rest_framework.response import Response
+
+
+class AnonymousCacheMixin:
+    """Кэширует ответы list и retrieve для анонимных пользователей.
+
+    Ключ складывается из адреса, нормализованной строки запроса и
+    поколений моделей из cache_generations, поэтому после любой записи
+    в эти модели старые ответы просто перестают находиться. Ответ,
+    который поколениями не описывается (described_by_generations), или
+    прочитанный с реплики вскоре после записи не кэшируется: реплика
+    могла ещё не догнать новое поколение.
+    """
+
+    cache_alias = 'responses'
+    cache_generations = ()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def get_cache_key(self, request, generations):
+        query = '&'.join(
+            f'{key}={",".join(sorted(values))}'
+            for key, values in sorted(request.query_params.lists())
+        )
+        raw_key = '|'.join(map(str, (
+            request.get_host(),
+            request.path,
+            query,
+            *generations
+        )))
+        return 'response:' + hashlib.md5(raw_key.encode()).hexdigest()
+
+    def described_by_generations(self):
+        """Меняется ли ответ на этот запрос только со сменой поколений."""
+        return True
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if (not request.user.is_anonymous
+                or not self.described_by_generations()):
+            return handler(request, *args, **kwargs)
+        cache = caches[self.cache_alias]
+        generations = get_generations(*self.cache_generations)
+        key = self.get_cache_key(request, generations)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200 and not dbrouters.may_read_stale(
+            max(generations, default=0)
+        ):
+            cache.set(key, response.data)
+        return response
+
+
+class ConditionalMixin:
+    """ETag и Last-Modified для list и retrieve с ответом 304.
+
+    Валидаторы складываются из поколений conditional_generations, а при
+    conditional_per_viewer ещё из id и поколения пользователя, от
+    которого зависят его флаги, поэтому не требуют ни сериализации, ни
+    запросов к базе. Ответ, прочитанный с реплики вскоре после смены
+    поколения, валидаторов не получает.
+    """
+
+    conditional_generations = ()
+    conditional_per_viewer = False
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+    def described_by_generations(self):
+        """Меняется ли ответ на этот запрос только со сменой поколений."""
+        return True
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        if not self.described_by_generations():
+            return handler(request, *args, **kwargs)
+        names = self.conditional_generations
+        viewer = None
+        if self.conditional_per_viewer and not request.user.is_anonymous:
+            viewer = request.user.pk
+            names += (viewer_generation(viewer),)
+        generations = get_generations(*names)
+        etag = 'W/"{}"'.format(hashlib.md5(
+            repr((viewer, generations)).encode()
+        ).hexdigest())
+        last_modified = int(max(generations, default=0))
+        response = get_conditional_response(
+            request, etag=etag, last_modified=last_modified
+        )
+        if response is None:
+            response = handler(request, *args, **kwargs)
+        if (response.status_code in (200, 304)
+                and not dbrouters.may_read_stale(last_modified)):
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(last_modified)
+            if self.conditional_per_viewer:
+                patch_vary_headers(response, ['Authorization'])
+        return response
+
+
+class RateLimitHeadersMixin:
+    """Добавляет к ответу заголовки X-RateLimit-*, которые оставил
+    TokenBucketThrottle; Retry-After при 429 ставит сам DRF.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        for header, value in getattr(request, 'rate_limit', {}).items():
+            response[header] = value
+        return response
@@ -1,6 +1,60 @@
-from rest_framework.pagination import PageNumberPagination
+from django.core.paginator import Paginator
+from django.db.models import QuerySet
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+
+class PkCountPaginator(Paginator):
+    """Считает строки по pk: аннотации, которые нужны только для
+    вывода страницы (флаги with_user_flags), в COUNT не попадают.
+    """
+
+    @cached_property
+    def count(self):
+        if isinstance(self.object_list, QuerySet):
+            return self.object_list.values('pk').count()
+        return super().count
 
 
 class LimitPagination(PageNumberPagination):
+    django_paginator_class = PkCountPaginator
+    page_size = 6
+    page_size_query_param = 'limit'
+
+
+class LimitCursorPagination(CursorPagination):
     page_size = 6
     page_size_query_param = 'limit'
+    ordering = '-id'
+
+
+class LimitOrCursorPagination(LimitPagination):
+    """Пагинация по page и limit, а при наличии ?cursor — по ключу.
+
+    Курсорный режим не выполняет COUNT и не использует OFFSET для
+    глубоких страниц; первую страницу запрашивают с пустым ?cursor=.
+    Курсор сортирует по своему ключу, поэтому выборки с другим порядком
+    (релевантность поиска, ?ordering) листаются по page и limit.
+    """
+
+    cursor_query_param = 'cursor'
+    cursor_pagination_class = LimitCursorPagination
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if (self.cursor_query_param in request.query_params
+                and self.keeps_order(queryset)):
+            self.cursor_paginator = self.cursor_pagination_class()
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def keeps_order(self, queryset):
+        ordering = queryset.query.order_by or queryset.model._meta.ordering
+        return tuple(ordering) == (self.cursor_pagination_class.ordering,)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
@@ -0,0 +1,55 @@
+import json
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.parsers import BaseParser
+
+
+class PayloadTooLarge(APIException):
+    status_code = status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    default_detail = 'Слишком большой запрос.'
+    default_code = 'payload_too_large'
+
+
+class NDJSONParser(BaseParser):
+    """Разбирает NDJSON: по одному JSON-объекту в строке.
+
+    Возвращает итератор: строки читаются и разбираются по мере того,
+    как их забирает view, так что тело запроса целиком в памяти не
+    держится. Больше IMPORT_MAX_BYTES байт или IMPORT_MAX_ROWS строк
+    не читается — это ответ 413.
+    """
+
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+        return self.rows(stream, encoding)
+
+    def rows(self, stream, encoding):
+        remaining = settings.IMPORT_MAX_BYTES
+        number = rows = 0
+        while True:
+            line = stream.readline(remaining + 1)
+            if not line:
+                return
+            remaining -= len(line)
+            if remaining < 0:
+                raise PayloadTooLarge(
+                    f'Больше {settings.IMPORT_MAX_BYTES} байт.'
+                )
+            number += 1
+            line = line.decode(encoding).strip()
+            if not line:
+                continue
+            rows += 1
+            if rows > settings.IMPORT_MAX_ROWS:
+                raise PayloadTooLarge(
+                    f'Больше {settings.IMPORT_MAX_ROWS} рецептов.'
+                )
+            try:
+                yield json.loads(line)
+            except ValueError as error:
+                raise ParseError(f'Строка {number}: {error}')
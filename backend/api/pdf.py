@@ -0,0 +1,444 @@
+import os
+import struct
+import zlib
+from functools import lru_cache
+
+PAGE_WIDTH, PAGE_HEIGHT = 595, 842
+MARGIN = 50
+FONT_SIZE = 12
+LEADING = 18
+INDENT = 24
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+SUBSET_TABLES = (
+    b'cvt ', b'fpgm', b'glyf', b'head', b'hhea', b'hmtx', b'loca', b'maxp',
+    b'prep'
+)
+ARG_1_AND_2_ARE_WORDS, WE_HAVE_A_SCALE = 0x0001, 0x0008
+MORE_COMPONENTS, WE_HAVE_AN_X_AND_Y_SCALE = 0x0020, 0x0040
+WE_HAVE_A_TWO_BY_TWO = 0x0080
+
+
+def _checksum(data):
+    data += b'\0' * (-len(data) % 4)
+    return sum(struct.unpack(f'>{len(data) // 4}I', data)) & 0xFFFFFFFF
+
+
+def _pack_font(tables):
+    """Собирает файл TrueType из таблиц {тег: байты}."""
+    count = len(tables)
+    power = 1 << (count.bit_length() - 1)
+    header = struct.pack(
+        '>IHHHH', 0x00010000, count, power * 16, power.bit_length() - 1,
+        count * 16 - power * 16
+    )
+    offset = len(header) + 16 * count
+    records, bodies, offsets = b'', b'', {}
+    for tag in sorted(tables):
+        data = tables[tag]
+        records += struct.pack(
+            '>4sIII', tag, _checksum(data), offset, len(data)
+        )
+        offsets[tag] = offset
+        padded = data + b'\0' * (-len(data) % 4)
+        bodies += padded
+        offset += len(padded)
+    font = header + records + bodies
+    head = offsets[b'head']
+    adjustment = (0xB1B0AFBA - _checksum(font)) & 0xFFFFFFFF
+    return font[:head + 8] + struct.pack('>I', adjustment) + font[head + 12:]
+
+
+class TrueTypeFont:
+    """TrueType-шрифт: метрики, таблица символов и подмножество глифов
+    для встраивания в PDF.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as font_file:
+            self.data = font_file.read()
+        self.name = os.path.splitext(
+            os.path.basename(path)
+        )[0].replace(' ', '')
+        self.tables = {}
+        count = struct.unpack_from('>H', self.data, 4)[0]
+        for index in range(count):
+            tag, _, offset, length = struct.unpack_from(
+                '>4sIII', self.data, 12 + 16 * index
+            )
+            self.tables[tag] = (offset, length)
+        head, hhea = self.offset(b'head'), self.offset(b'hhea')
+        self.units = struct.unpack_from('>H', self.data, head + 18)[0]
+        self.bbox = [
+            self.scale(value)
+            for value in struct.unpack_from('>4h', self.data, head + 36)
+        ]
+        self.long_loca = struct.unpack_from('>h', self.data, head + 50)[0]
+        ascent, descent = struct.unpack_from('>2h', self.data, hhea + 4)
+        self.ascent, self.descent = self.scale(ascent), self.scale(descent)
+        self.metrics_count = struct.unpack_from(
+            '>H', self.data, hhea + 34
+        )[0]
+        self.glyph_count = struct.unpack_from(
+            '>H', self.data, self.offset(b'maxp') + 4
+        )[0]
+        self.glyphs = self._read_cmap()
+
+    def offset(self, tag):
+        if tag not in self.tables:
+            raise ValueError(f'В шрифте нет таблицы {tag.decode()}')
+        return self.tables[tag][0]
+
+    def table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    def scale(self, value):
+        return value * 1000 // self.units
+
+    def _read_cmap(self):
+        """Соответствие {код символа: номер глифа} из юникодной таблицы
+        cmap формата 4.
+        """
+        cmap = self.offset(b'cmap')
+        count = struct.unpack_from('>H', self.data, cmap + 2)[0]
+        for index in range(count):
+            platform, encoding, offset = struct.unpack_from(
+                '>HHI', self.data, cmap + 4 + 8 * index
+            )
+            subtable = cmap + offset
+            if ((platform, encoding) in ((3, 1), (0, 3))
+                    and struct.unpack_from('>H', self.data, subtable)[0] == 4):
+                break
+        else:
+            raise ValueError('В шрифте нет юникодной таблицы cmap')
+        segments = struct.unpack_from('>H', self.data, subtable + 6)[0] // 2
+        ends = subtable + 14
+        starts = ends + 2 * segments + 2
+        deltas = starts + 2 * segments
+        range_offsets = deltas + 2 * segments
+        glyphs = {}
+        for segment in range(segments):
+            end, start, delta, range_offset = (
+                struct.unpack_from(
+                    '>H', self.data, table + 2 * segment
+                )[0]
+                for table in (ends, starts, deltas, range_offsets)
+            )
+            position = range_offsets + 2 * segment
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if not range_offset:
+                    glyph = (code + delta) & 0xFFFF
+                else:
+                    glyph = struct.unpack_from(
+                        '>H', self.data,
+                        position + range_offset + 2 * (code - start)
+                    )[0]
+                    glyph = (glyph + delta) & 0xFFFF if glyph else 0
+                if glyph:
+                    glyphs[code] = glyph
+        return glyphs
+
+    def glyph(self, char):
+        return self.glyphs.get(ord(char), 0)
+
+    def advance(self, glyph):
+        """Ширина глифа в тысячных долях кегля."""
+        index = min(glyph, self.metrics_count - 1)
+        return self.scale(struct.unpack_from(
+            '>H', self.data, self.offset(b'hmtx') + 4 * index
+        )[0])
+
+    def width(self, text, size):
+        return sum(
+            self.advance(self.glyph(char)) for char in text
+        ) * size / 1000
+
+    def _glyph_data(self, glyph):
+        loca = self.offset(b'loca')
+        if self.long_loca:
+            start, end = struct.unpack_from('>2I', self.data, loca + 4 * glyph)
+        else:
+            start, end = (
+                2 * value for value in
+                struct.unpack_from('>2H', self.data, loca + 2 * glyph)
+            )
+        glyf = self.offset(b'glyf')
+        return self.data[glyf + start:glyf + end]
+
+    def _components(self, data):
+        """Составные части глифа: (смещение номера части в данных глифа,
+        номер глифа части); у простого глифа частей нет.
+        """
+        if not data or struct.unpack_from('>h', data)[0] >= 0:
+            return
+        position = 10
+        while True:
+            flags, glyph = struct.unpack_from('>2H', data, position)
+            yield position + 2, glyph
+            position += 4 + (4 if flags & ARG_1_AND_2_ARE_WORDS else 2)
+            if flags & WE_HAVE_A_SCALE:
+                position += 2
+            elif flags & WE_HAVE_AN_X_AND_Y_SCALE:
+                position += 4
+            elif flags & WE_HAVE_A_TWO_BY_TWO:
+                position += 8
+            if not flags & MORE_COMPONENTS:
+                return
+
+    def _metrics(self, glyph):
+        hmtx = self.offset(b'hmtx')
+        if glyph < self.metrics_count:
+            return self.data[hmtx + 4 * glyph:hmtx + 4 * glyph + 4]
+        bearing = hmtx + 4 * self.metrics_count + 2 * (
+            glyph - self.metrics_count
+        )
+        return self.data[
+            hmtx + 4 * self.metrics_count - 4:
+            hmtx + 4 * self.metrics_count - 2
+        ] + self.data[bearing:bearing + 2]
+
+    def subset(self, glyphs):
+        """Файл шрифта только с нужными глифами.
+
+        glyphs — номера глифов исходного шрифта, начиная с 0 (.notdef);
+        в подмножестве глиф получает номер своей позиции в списке.
+        Части составных глифов дописываются в конец, а ссылки на них
+        перенумеровываются.
+        """
+        order = list(glyphs)
+        numbers = {glyph: number for number, glyph in enumerate(order)}
+        glyf, loca, metrics = b'', [0], b''
+        for glyph in order:
+            data = bytearray(self._glyph_data(glyph))
+            for position, part in self._components(bytes(data)):
+                if part not in numbers:
+                    numbers[part] = len(order)
+                    order.append(part)
+                struct.pack_into('>H', data, position, numbers[part])
+            glyf += bytes(data) + b'\0' * (-len(data) % 4)
+            loca.append(len(glyf))
+            metrics += self._metrics(glyph)
+        tables = {
+            tag: self.table(tag) for tag in SUBSET_TABLES
+            if tag in self.tables
+        }
+        tables[b'glyf'] = glyf
+        tables[b'loca'] = struct.pack(f'>{len(loca)}I', *loca)
+        tables[b'hmtx'] = metrics
+        head = tables[b'head']
+        tables[b'head'] = (
+            head[:8] + b'\0' * 4 + head[12:50] + struct.pack('>h', 1)
+            + head[52:]
+        )
+        hhea = tables[b'hhea']
+        tables[b'hhea'] = (
+            hhea[:34] + struct.pack('>H', len(order)) + hhea[36:]
+        )
+        maxp = tables[b'maxp']
+        tables[b'maxp'] = (
+            maxp[:4] + struct.pack('>H', len(order)) + maxp[6:]
+        )
+        return _pack_font(tables)
+
+
+@lru_cache(maxsize=None)
+def load_font(path):
+    return TrueTypeFont(path)
+
+
+def wrap(font, text, width, indent=INDENT, size=FONT_SIZE):
+    """Разбивает строку на строки не шире width и возвращает их
+    с отступами: по пробелам, а слишком длинные слова — по символам.
+    Продолжение строки сдвигается вправо на indent.
+    """
+    rows, line = [], ''
+
+    def fits(text):
+        return font.width(text, size) <= width - (indent if rows else 0)
+
+    for word in text.split(' '):
+        candidate = f'{line} {word}' if line else word
+        if fits(candidate):
+            line = candidate
+            continue
+        if line:
+            rows.append(line)
+        line = ''
+        for char in word:
+            if line and not fits(line + char):
+                rows.append(line)
+                line = ''
+            line += char
+    rows.append(line)
+    return [
+        (indent if number else 0, row) for number, row in enumerate(rows)
+    ]
+
+
+def _to_unicode(chars):
+    mappings = [
+        f'<{code:04X}> <{"".join(f"{unit:04X}" for unit in units)}>\n'
+        for code, units in sorted(chars.items())
+    ]
+    blocks = ''.join(
+        f'{len(chunk)} beginbfchar\n{"".join(chunk)}endbfchar\n'
+        for chunk in (
+            mappings[start:start + 100]
+            for start in range(0, len(mappings), 100)
+        )
+    )
+    return (
+        '/CIDInit /ProcSet findresource begin\n12 dict begin\nbegincmap\n'
+        '/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) '
+        '/Supplement 0 >> def\n'
+        '/CMapName /Adobe-Identity-UCS def\n/CMapType 2 def\n'
+        '1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange\n'
+        f'{blocks}'
+        'endcmap\nCMapName currentdict /CMap defineresource pop\nend\nend'
+    ).encode()
+
+
+def _utf16_units(char):
+    encoded = char.encode('utf-16-be')
+    return struct.unpack(f'>{len(encoded) // 2}H', encoded)
+
+
+class StreamingPDF:
+    """Пишет PDF по страницам, не держа документ в памяти целиком.
+
+    Номера объектов каталога, дерева страниц и шрифта резервируются
+    заранее. Глифы получают номера по мере появления на страницах,
+    и в конце документа встраивается подмножество шрифта только с ними;
+    дерево страниц со списком всех страниц дописывается вместе
+    с таблицей xref.
+    """
+
+    CATALOG, PAGES, FONT = 1, 2, 3
+
+    def __init__(self, font):
+        self.font = font
+        self.offsets = {}
+        self.position = 0
+        self.next_number = self.FONT + 1
+        self.page_numbers = []
+        self.glyphs = [0]
+        self.codes = {0: 0}
+        self.chars = {}
+
+    def _allocate(self):
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def _write(self, chunk):
+        self.position += len(chunk)
+        return chunk
+
+    def _object(self, number, body):
+        self.offsets[number] = self.position
+        return self._write(
+            f'{number} 0 obj\n'.encode() + body + b'\nendobj\n'
+        )
+
+    def _stream(self, number, content, extra=''):
+        content = zlib.compress(content)
+        return self._object(
+            number,
+            f'<< /Length {len(content)} /Filter /FlateDecode{extra} >>\n'
+            f'stream\n'.encode() + content + b'\nendstream'
+        )
+
+    def _encode(self, text):
+        codes = []
+        for char in text:
+            glyph = self.font.glyph(char)
+            if glyph not in self.codes:
+                self.codes[glyph] = len(self.glyphs)
+                self.glyphs.append(glyph)
+            code = self.codes[glyph]
+            self.chars.setdefault(code, _utf16_units(char))
+            codes.append(f'{code:04X}')
+        return f'<{"".join(codes)}>'.encode()
+
+    def _font(self):
+        descriptor, font_file, cid_font, to_unicode = (
+            self._allocate() for _ in range(4)
+        )
+        name = f'AAAAAA+{self.font.name}'
+        widths = ' '.join(
+            str(self.font.advance(glyph)) for glyph in self.glyphs
+        )
+        yield self._object(self.FONT, (
+            f'<< /Type /Font /Subtype /Type0 /BaseFont /{name} '
+            f'/Encoding /Identity-H /DescendantFonts [{cid_font} 0 R] '
+            f'/ToUnicode {to_unicode} 0 R >>'
+        ).encode())
+        yield self._object(cid_font, (
+            f'<< /Type /Font /Subtype /CIDFontType2 /BaseFont /{name} '
+            f'/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) '
+            f'/Supplement 0 >> /FontDescriptor {descriptor} 0 R '
+            f'/CIDToGIDMap /Identity /W [0 [{widths}]] >>'
+        ).encode())
+        yield self._object(descriptor, (
+            f'<< /Type /FontDescriptor /FontName /{name} /Flags 4 '
+            f'/FontBBox [{" ".join(map(str, self.font.bbox))}] '
+            f'/ItalicAngle 0 /Ascent {self.font.ascent} '
+            f'/Descent {self.font.descent} /CapHeight {self.font.ascent} '
+            f'/StemV 80 /FontFile2 {font_file} 0 R >>'
+        ).encode())
+        subset = self.font.subset(self.glyphs)
+        yield self._stream(font_file, subset, f' /Length1 {len(subset)}')
+        yield self._stream(to_unicode, _to_unicode(self.chars))
+
+    def _page(self, lines):
+        content = f'BT /F1 {FONT_SIZE} Tf\n'.encode() + b''.join(
+            f'1 0 0 1 {MARGIN + indent} '
+            f'{PAGE_HEIGHT - MARGIN - LEADING * row} Tm '.encode()
+            + self._encode(text) + b' Tj\n'
+            for row, (indent, text) in enumerate(lines, start=1)
+        ) + b'ET'
+        content_number, page_number = self._allocate(), self._allocate()
+        self.page_numbers.append(page_number)
+        yield self._stream(content_number, content)
+        yield self._object(page_number, (
+            f'<< /Type /Page /Parent {self.PAGES} 0 R '
+            f'/MediaBox [0 0 {PAGE_WIDTH} {PAGE_HEIGHT}] '
+            f'/Resources << /Font << /F1 {self.FONT} 0 R >> >> '
+            f'/Contents {content_number} 0 R >>'
+        ).encode())
+
+    def render(self, lines):
+        """Генератор байтов документа; каждая страница отдаётся сразу."""
+        yield self._write(b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n')
+        yield self._object(
+            self.CATALOG, f'<< /Type /Catalog /Pages {self.PAGES} 0 R >>'
+            .encode()
+        )
+        page = []
+        rows = (
+            row for line in lines
+            for row in wrap(self.font, line, PAGE_WIDTH - 2 * MARGIN)
+        )
+        for row in rows:
+            page.append(row)
+            if len(page) == LINES_PER_PAGE:
+                yield from self._page(page)
+                page = []
+        if page or not self.page_numbers:
+            yield from self._page(page)
+        yield from self._font()
+        kids = ' '.join(f'{number} 0 R' for number in self.page_numbers)
+        yield self._object(self.PAGES, (
+            f'<< /Type /Pages /Kids [{kids}] '
+            f'/Count {len(self.page_numbers)} >>'
+        ).encode())
+        xref = self.position
+        entries = ''.join(
+            f'{self.offsets[number]:010d} 00000 n \n'
+            for number in range(1, self.next_number)
+        )
+        yield self._write((
+            f'xref\n0 {self.next_number}\n0000000000 65535 f \n{entries}'
+            f'trailer\n<< /Size {self.next_number} '
+            f'/Root {self.CATALOG} 0 R >>\nstartxref\n{xref}\n%%EOF\n'
+        ).encode())
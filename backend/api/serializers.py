@@ -1,13 +1,80 @@
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer, UserSerializer
 from drf_extra_fields.fields import Base64ImageField
+from recipes import cart, tasks
+from recipes.counters import shift_counter
+from recipes.generations import bump_generation
+from recipes.images import variant_url
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
-from rest_framework.serializers import (IntegerField, ModelSerializer,
+                            ShoppingCart, ShoppingCartTotal, Tag)
+from recipes.search import update_search_vectors
+from rest_framework.serializers import (IntegerField, ListField,
+                                        ListSerializer, ModelSerializer,
                                         PrimaryKeyRelatedField, ReadOnlyField,
-                                        SerializerMethodField, ValidationError)
+                                        Serializer, SerializerMethodField,
+                                        ValidationError)
 from users.models import Subscription, User
 
 
+def image_variant_url(serializer, recipe, name, image_format=None):
+    if not recipe.image:
+        return None
+    url = variant_url(recipe, name, image_format)
+    request = serializer.context.get('request')
+    return request.build_absolute_uri(url) if request else url
+
+
+def query_names(request, param):
+    """Множество имён из параметра запроса через запятую или None."""
+    value = request.query_params.get(param) if request else None
+    if value is None:
+        return None
+    return {name.strip() for name in value.split(',') if name.strip()}
+
+
+def requested_fields(request):
+    """Поля ответа из ?fields= (None — все поля) и раскрываемые
+    вложенные объекты из ?expand=.
+    """
+    return (
+        query_names(request, 'fields'),
+        query_names(request, 'expand') or set()
+    )
+
+
+class DynamicFieldsMixin:
+    """Поддержка ?fields= и ?expand= для сериализатора верхнего уровня.
+
+    С ?fields= остаются только перечисленные поля, остальные не
+    вычисляются вовсе, а вложенные объекты из get_collapsed_fields
+    заменяются их id, если их нет в ?expand=. Без ?fields= ответ
+    прежний, со всеми полями и вложенными объектами.
+    """
+
+    def get_collapsed_fields(self):
+        return {}
+
+    def is_root(self):
+        parent = self.parent
+        if isinstance(parent, ListSerializer):
+            parent = parent.parent
+        return parent is None
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not self.is_root():
+            return fields
+        only, expand = requested_fields(self.context.get('request'))
+        if only is None:
+            return fields
+        for name in set(fields) - only - expand:
+            del fields[name]
+        for name, field in self.get_collapsed_fields().items():
+            if name in fields and name not in expand:
+                fields[name] = field
+        return fields
+
+
 class CustomUserCreateSerializer(UserCreateSerializer):
     class Meta:
         model = User
@@ -15,7 +82,7 @@ class CustomUserCreateSerializer(UserCreateSerializer):
                   'password')
 
 
-class CustomUserSerializer(UserSerializer):
+class CustomUserSerializer(DynamicFieldsMixin, UserSerializer):
     is_subscribed = SerializerMethodField()
 
     class Meta:
@@ -24,6 +91,8 @@ class CustomUserSerializer(UserSerializer):
                   'is_subscribed')
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         user = self.context.get('request').user
         return not user.is_anonymous and Subscription.objects.filter(
             user=user,
@@ -53,7 +122,7 @@ class RecipeIngredientSerializer(ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
-class RecipeSerializer(ModelSerializer):
+class RecipeSerializer(DynamicFieldsMixin, ModelSerializer):
     tags = TagSerializer(read_only=True, many=True)
     author = CustomUserSerializer(read_only=True)
     ingredients = RecipeIngredientSerializer(
@@ -63,25 +132,60 @@ class RecipeSerializer(ModelSerializer):
     )
     is_favorited = SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField()
+    image_thumb = SerializerMethodField()
+    image_medium = SerializerMethodField()
+    image_thumb_jpeg = SerializerMethodField()
+    image_medium_jpeg = SerializerMethodField()
 
     class Meta:
         model = Recipe
         fields = ('id', 'tags', 'author', 'ingredients', 'is_favorited',
-                  'is_in_shopping_cart', 'name', 'image', 'text',
-                  'cooking_time')
+                  'is_in_shopping_cart', 'name', 'image', 'image_thumb',
+                  'image_medium', 'image_thumb_jpeg', 'image_medium_jpeg',
+                  'text', 'cooking_time')
+
+    def get_collapsed_fields(self):
+        return {
+            'author': PrimaryKeyRelatedField(read_only=True),
+            'tags': PrimaryKeyRelatedField(read_only=True, many=True),
+            'ingredients': PrimaryKeyRelatedField(
+                read_only=True, many=True
+            ),
+        }
+
+    def to_representation(self, recipe):
+        if hasattr(recipe, 'author_is_subscribed'):
+            recipe.author.is_subscribed = recipe.author_is_subscribed
+        return super().to_representation(recipe)
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, 'is_favorited'):
+            return recipe.is_favorited
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return Favorite.objects.filter(user=user, recipe=recipe).exists()
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, 'is_in_shopping_cart'):
+            return recipe.is_in_shopping_cart
         user = self.context.get('request').user
         if user.is_anonymous:
             return False
         return ShoppingCart.objects.filter(user=user, recipe=recipe).exists()
 
+    def get_image_thumb(self, recipe):
+        return image_variant_url(self, recipe, 'thumb')
+
+    def get_image_medium(self, recipe):
+        return image_variant_url(self, recipe, 'medium')
+
+    def get_image_thumb_jpeg(self, recipe):
+        return image_variant_url(self, recipe, 'thumb', 'JPEG')
+
+    def get_image_medium_jpeg(self, recipe):
+        return image_variant_url(self, recipe, 'medium', 'JPEG')
+
 
 class AddIngredientRecipeSerializer(ModelSerializer):
     id = IntegerField()
@@ -92,13 +196,140 @@ class AddIngredientRecipeSerializer(ModelSerializer):
         fields = ['id', 'amount']
 
 
+class RecipeImageField(Base64ImageField):
+    """Картинка в base64 или ссылка на текущую картинку рецепта."""
+
+    def to_internal_value(self, data):
+        recipe = self.parent.instance
+        if (isinstance(recipe, Recipe) and recipe.image
+                and isinstance(data, str)
+                and data.endswith(recipe.image.url)):
+            return recipe.image
+        return super().to_internal_value(data)
+
+
+def is_same_image(current, uploaded):
+    if uploaded is current:
+        return True
+    if not current:
+        return False
+    try:
+        if current.size != uploaded.size:
+            return False
+        with current.storage.open(current.name, 'rb') as current_file:
+            same = current_file.read() == uploaded.read()
+        uploaded.seek(0)
+        return same
+    except OSError:
+        return False
+
+
+class PreloadedTagField(PrimaryKeyRelatedField):
+    """Берёт теги из context['tags'], если они загружены заранее."""
+
+    def to_internal_value(self, data):
+        tags = self.context.get('tags')
+        if tags is None:
+            return super().to_internal_value(data)
+        try:
+            return tags[int(data)]
+        except (KeyError, TypeError, ValueError):
+            self.fail('does_not_exist', pk_value=data)
+
+
+class RecipeListSerializer(ListSerializer):
+    """Массовое создание рецептов пачками по batch_size.
+
+    Ингредиенты, теги и занятые названия загружаются один раз на весь
+    импорт, а рецепты, их ингредиенты и теги пишутся через bulk_create.
+    Сигналы при этом не срабатывают, поэтому счётчик рецептов автора,
+    поисковые векторы и поколения обновляются здесь, а копии картинок,
+    ленты подписчиков и похожие рецепты ставятся в очередь одной
+    задачей на сохранённый список.
+    """
+
+    batch_size = 500
+
+    def to_internal_value(self, data):
+        if isinstance(data, list):
+            self.preload(data)
+        return super().to_internal_value(data)
+
+    def preload(self, rows):
+        rows = [row for row in rows if isinstance(row, dict)]
+        ingredient_ids = {
+            int(item['id'])
+            for row in rows
+            for item in row.get('ingredients') or ()
+            if isinstance(item, dict) and str(item.get('id')).isdigit()
+        }
+        self.context.update(
+            ingredients=Ingredient.objects.in_bulk(ingredient_ids),
+            tags=Tag.objects.in_bulk(),
+            recipe_names=set(Recipe.objects.filter(
+                author=self.context['request'].user,
+                name__in=[str(row.get('name')) for row in rows]
+            ).values_list('name', flat=True))
+        )
+
+    @transaction.atomic
+    def create(self, validated_data):
+        author = self.context['request'].user
+        recipes = []
+        for start in range(0, len(validated_data), self.batch_size):
+            recipes.extend(self.create_batch(
+                author, validated_data[start:start + self.batch_size]
+            ))
+        shift_counter(Recipe, author.pk, len(recipes))
+        update_search_vectors(
+            Recipe.objects.filter(pk__in=[recipe.pk for recipe in recipes])
+        )
+        bump_generation('recipe')
+        recipe_ids = [recipe.pk for recipe in recipes]
+        tasks.generate_recipes_image_variants.delay(recipe_ids)
+        tasks.fan_out_recipes.delay(recipe_ids)
+        tasks.update_similar_recipes.delay(recipe_ids)
+        return recipes
+
+    def create_batch(self, author, batch):
+        recipes = Recipe.objects.bulk_create([
+            Recipe(author=author, **{
+                field: value for field, value in data.items()
+                if field not in ('ingredients', 'tags')
+            })
+            for data in batch
+        ])
+        if recipes and recipes[0].pk is None:
+            ids = dict(Recipe.objects.filter(
+                author=author,
+                name__in=[recipe.name for recipe in recipes]
+            ).values_list('name', 'id'))
+            for recipe in recipes:
+                recipe.pk = ids[recipe.name]
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient['id'],
+                amount=ingredient['amount']
+            )
+            for recipe, data in zip(recipes, batch)
+            for ingredient in data['ingredients']
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag.pk)
+            for recipe, data in zip(recipes, batch)
+            for tag in dict.fromkeys(data['tags'])
+        ])
+        return recipes
+
+
 class CreateRecipeSerializer(ModelSerializer):
     author = CustomUserSerializer(read_only=True)
     ingredients = AddIngredientRecipeSerializer(many=True)
-    tags = PrimaryKeyRelatedField(
+    tags = PreloadedTagField(
         queryset=Tag.objects.all(), many=True
     )
-    image = Base64ImageField()
+    image = RecipeImageField()
 
     class Meta:
         model = Recipe
@@ -112,9 +343,12 @@ class CreateRecipeSerializer(ModelSerializer):
             'text',
             'cooking_time'
         ]
+        list_serializer_class = RecipeListSerializer
 
     def validate(self, data):
         ingredients = data.get('ingredients')
+        if ingredients is None and self.partial:
+            return data
         if not ingredients:
             raise ValidationError(
                 'В рецепте должен быть хотя бы один ингредиент!'
@@ -131,6 +365,16 @@ class CreateRecipeSerializer(ModelSerializer):
                     {'ingredient': 'Ингредиенты должны быть уникальными!'}
                 )
             ingredients_list.append(ingredient['id'])
+        known = self.context.get('ingredients')
+        if known is None:
+            known = Ingredient.objects.in_bulk(ingredients_list)
+        unknown = [pk for pk in ingredients_list if pk not in known]
+        if unknown:
+            raise ValidationError({'ingredients': (
+                'Ингредиенты не найдены: {}.'.format(
+                    ', '.join(map(str, unknown))
+                )
+            )})
         return data
 
     def validate_tags(self, tags):
@@ -149,7 +393,14 @@ class CreateRecipeSerializer(ModelSerializer):
     def validate_name(self, name):
         if not name:
             raise ValidationError('Не заполнено название рецепта!')
-        if self.context.get('request').method == 'POST':
+        recipe_names = self.context.get('recipe_names')
+        if recipe_names is not None:
+            if name in recipe_names:
+                raise ValidationError(
+                    'Рецепт с таким названием у вас уже есть!'
+                )
+            recipe_names.add(name)
+        elif self.context.get('request').method == 'POST':
             current_user = self.context.get('request').user
             if Recipe.objects.filter(author=current_user, name=name).exists():
                 raise ValidationError(
@@ -174,12 +425,13 @@ class CreateRecipeSerializer(ModelSerializer):
     def create_ingredients(self, ingredients, recipe):
         RecipeIngredient.objects.bulk_create(
             [RecipeIngredient(
-                ingredient=Ingredient.objects.get(id=ingredient['id']),
+                ingredient_id=ingredient['id'],
                 recipe=recipe,
                 amount=ingredient['amount']
             ) for ingredient in ingredients]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
@@ -189,15 +441,61 @@ class CreateRecipeSerializer(ModelSerializer):
         recipe.tags.set(tags)
         return recipe
 
+    def update_ingredients(self, recipe, ingredients):
+        """Пишет только разницу между текущими и новыми ингредиентами
+        и сообщает, было ли что записывать.
+        """
+        amounts = {
+            ingredient['id']: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed, changed, deltas = [], [], {}
+        for item in recipe.recipe_ingredients.all():
+            amount = amounts.pop(item.ingredient_id, None)
+            if amount is None:
+                removed.append(item.pk)
+                deltas[item.ingredient_id] = -item.amount
+            elif amount != item.amount:
+                deltas[item.ingredient_id] = amount - item.amount
+                item.amount = amount
+                changed.append(item)
+        if removed:
+            RecipeIngredient.objects.filter(pk__in=removed).delete()
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        if amounts:
+            self.create_ingredients([
+                {'id': ingredient_id, 'amount': amount}
+                for ingredient_id, amount in amounts.items()
+            ], recipe)
+            deltas.update(amounts)
+        if removed or amounts:
+            update_search_vectors(Recipe.objects.filter(pk=recipe.pk))
+        if deltas:
+            cart.change_recipe(recipe.pk, deltas)
+            tasks.update_similar_recipes.delay([recipe.pk])
+        return bool(removed or changed or amounts)
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        RecipeIngredient.objects.filter(recipe=instance).delete()
-        ingredients = validated_data.pop('ingredients')
-        tags = validated_data.pop('tags')
-        instance = super().update(instance, validated_data)
-        if ingredients:
-            instance.ingredients.clear()
-            self.create_ingredients(ingredients, instance)
-        if tags:
+        ingredients = validated_data.pop('ingredients', None)
+        tags = validated_data.pop('tags', None)
+        image = validated_data.get('image')
+        if image is not None and is_same_image(instance.image, image):
+            del validated_data['image']
+        changed = [
+            field for field, value in validated_data.items()
+            if getattr(instance, field) != value
+        ]
+        for field in changed:
+            setattr(instance, field, validated_data[field])
+        ingredients_changed = (
+            ingredients is not None
+            and self.update_ingredients(instance, ingredients)
+        )
+        if changed or ingredients_changed:
+            instance.save(update_fields=[*changed, 'updated_at'])
+        if tags is not None:
             instance.tags.set(tags)
         return instance
 
@@ -207,31 +505,63 @@ class CreateRecipeSerializer(ModelSerializer):
         }).data
 
 
+class ShoppingCartTotalSerializer(ModelSerializer):
+    class Meta:
+        model = ShoppingCartTotal
+        fields = ('name', 'measurement_unit', 'amount')
+
+
+class RecipeIdsSerializer(Serializer):
+    ids = ListField(
+        child=IntegerField(min_value=1), allow_empty=False, max_length=100
+    )
+
+    def validate_ids(self, ids):
+        return list(dict.fromkeys(ids))
+
+
 class RecipeMinifiedSerializer(ModelSerializer):
-    image = Base64ImageField()
+    image = SerializerMethodField()
+    image_medium = SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'image_medium', 'cooking_time')
+
+    def get_image(self, recipe):
+        return image_variant_url(self, recipe, 'thumb')
+
+    def get_image_medium(self, recipe):
+        return image_variant_url(self, recipe, 'medium')
 
 
 class SubscriptionSerializer(CustomUserSerializer):
     recipes = SerializerMethodField()
-    recipes_count = SerializerMethodField()
+    recipes_count = ReadOnlyField()
 
     class Meta:
         model = User
         fields = ('email', 'id', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
 
-    def get_recipes_count(self, author):
-        return author.recipes.count()
+    def get_collapsed_fields(self):
+        return {'recipes': SerializerMethodField('get_recipe_ids')}
 
-    def get_recipes(self, author):
+    def get_recipe_ids(self, author):
+        return [recipe.pk for recipe in self.get_recipe_list(author)]
+
+    def get_recipe_list(self, author):
+        if hasattr(author, 'limited_recipes'):
+            return author.limited_recipes
         recipes = author.recipes.all()
         recipes_limit = self.context.get('request').query_params.get(
             'recipes_limit'
         )
         if recipes_limit:
             recipes = recipes[:int(recipes_limit)]
-        return RecipeMinifiedSerializer(recipes, many=True).data
+        return recipes
+
+    def get_recipes(self, author):
+        return RecipeMinifiedSerializer(
+            self.get_recipe_list(author), many=True, context=self.context
+        ).data
@@ -0,0 +1,61 @@
+import csv
+
+from django.conf import settings
+
+from .pdf import StreamingPDF, load_font
+
+TITLE = 'Список покупок'
+CSV_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+
+
+def ingredient_lines(ingredients):
+    for ingredient in ingredients:
+        yield '{} ({}) - {}'.format(
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            ingredient['amount']
+        )
+
+
+class Echo:
+    """Псевдо-файл для csv.writer: возвращает строку вместо записи."""
+
+    def write(self, value):
+        return value
+
+
+def render_txt(ingredients):
+    for line in ingredient_lines(ingredients):
+        yield f'{line}\n'.encode()
+
+
+def render_csv(ingredients):
+    writer = csv.writer(Echo())
+    yield writer.writerow(CSV_HEADER).encode()
+    for ingredient in ingredients:
+        yield writer.writerow((
+            ingredient['name'],
+            ingredient['measurement_unit'],
+            ingredient['amount']
+        )).encode()
+
+
+def render_pdf(ingredients):
+    """PDF по страницам. Шрифт читается до начала ответа, чтобы ошибка
+    настройки не оборвала уже начатый документ.
+    """
+    pdf = StreamingPDF(load_font(settings.SHOPPING_LIST_FONT))
+    return pdf.render(_with_title(ingredient_lines(ingredients)))
+
+
+def _with_title(lines):
+    yield TITLE
+    yield ''
+    yield from lines
+
+
+FORMATS = {
+    'txt': ('text/plain; charset=utf-8', render_txt),
+    'csv': ('text/csv; charset=utf-8', render_csv),
+    'pdf': ('application/pdf', render_pdf),
+}
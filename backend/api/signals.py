@@ -0,0 +1,19 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from recipes.generations import bump_generation
+from rest_framework.authtoken.models import Token
+from users.models import User
+
+
+@receiver(post_delete, sender=Token)
+@receiver(post_delete, sender=User)
+def bump_auth_generation(**kwargs):
+    bump_generation('auth')
+
+
+@receiver(post_save, sender=User)
+def bump_auth_generation_on_user_change(created, update_fields=None,
+                                        **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+    bump_generation('auth')
@@ -0,0 +1,118 @@
+import math
+import threading
+import time
+
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.settings import api_settings
+from rest_framework.throttling import BaseThrottle
+
+CACHE_ALIAS = 'throttle'
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+LOCK_TIMEOUT = 1
+LOCK_WAIT = 0.1
+LOCK_DELAY = 0.001
+
+
+def parse_rate(rate):
+    """'30/min' -> (30, 60): объём ведра и время его полного наполнения."""
+    capacity, period = rate.split('/')
+    return int(capacity), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """Ведро токенов для запросов на запись к throttle_scope вида: своё
+    у каждого пользователя, а у анонимных клиентов — у каждого адреса.
+
+    Частота берётся из DEFAULT_THROTTLE_RATES по throttle_scope. Ведро
+    вмещает столько запросов, сколько разрешено за период, и равномерно
+    наполняется за этот период, так что короткие всплески проходят,
+    а частые запросы в цикле — нет. Состояние ведра хранится в общем
+    кэше throttle и меняется под блокировкой, чтобы параллельные запросы
+    не тратили один и тот же токен: внутри процесса — threading.Lock,
+    между процессами — cache.add. Атомарен add в memcached и Redis;
+    файловый кэш по умолчанию между процессами блокирует лишь примерно.
+    Занятая блокировка — не повод отказать: запрос ждёт её, а не
+    дождавшись, меняет ведро без неё.
+    """
+
+    local_lock = threading.Lock()
+
+    def __init__(self):
+        self.cache = caches[CACHE_ALIAS]
+        self.delay = None
+
+    def get_cache_key(self, request, view):
+        if request.user.is_authenticated:
+            ident = f'user:{request.user.pk}'
+        else:
+            ident = f'ip:{self.get_ident(request)}'
+        return f'throttle:{view.throttle_scope}:{ident}'
+
+    def allow_request(self, request, view):
+        if request.method in SAFE_METHODS:
+            return True
+        rate = api_settings.DEFAULT_THROTTLE_RATES.get(
+            getattr(view, 'throttle_scope', None)
+        )
+        if rate is None:
+            return True
+        capacity, duration = parse_rate(rate)
+        remaining, self.delay = self.take(
+            self.get_cache_key(request, view), capacity, duration
+        )
+        request.rate_limit = {
+            'X-RateLimit-Limit': str(capacity),
+            'X-RateLimit-Remaining': str(int(remaining)),
+            'X-RateLimit-Reset': str(math.ceil(
+                (capacity - remaining) * duration / capacity
+            )),
+        }
+        return not self.delay
+
+    def take(self, key, capacity, duration):
+        """Забирает токен из ведра key.
+
+        Возвращает остаток токенов и, если токена не нашлось, сколько
+        секунд ждать следующего (0, если токен выдан).
+        """
+        with self.local_lock:
+            return self.take_shared(key, capacity, duration)
+
+    def acquire(self, lock):
+        """Ждёт блокировку до LOCK_WAIT секунд с растущей паузой.
+
+        Возвращает False, если не дождался, например если другой процесс
+        упал, не сняв её: тогда лучше, в худшем случае, выдать лишний
+        токен, чем отказать клиенту, у которого токены есть.
+        """
+        delay, deadline = LOCK_DELAY, time.monotonic() + LOCK_WAIT
+        while not self.cache.add(lock, 1, LOCK_TIMEOUT):
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(delay)
+            delay *= 2
+        return True
+
+    def take_shared(self, key, capacity, duration):
+        lock = key + ':lock'
+        locked = self.acquire(lock)
+        try:
+            now = time.time()
+            tokens, updated = self.cache.get(key, (capacity, now))
+            tokens = min(
+                capacity, tokens + (now - updated) * capacity / duration
+            )
+            wait = 0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = (1 - tokens) * duration / capacity
+            self.cache.set(key, (tokens, now), duration)
+            return tokens, wait
+        finally:
+            if locked:
+                self.cache.delete(lock)
+
+    def wait(self):
+        return self.delay
@@ -1,30 +1,119 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from collections.abc import Iterator
+from itertools import islice
+
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import (BooleanField, Exists, OuterRef, Prefetch,
+                              Subquery, Value)
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
-from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+from recipes import cart
+from recipes.counters import shift_counters
+from recipes.feed import feed_queryset
+from recipes.generations import bump_generation, viewer_generation
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingCartTotal, SimilarRecipe, Tag)
 from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
+from rest_framework.filters import OrderingFilter
 from rest_framework.generics import ListAPIView
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 from users.models import Subscription, User
 
-from .filters import IngredientSearchFilter, RecipeFilter
-from .pagination import LimitPagination
+from . import shopping_list
+from .filters import (IngredientSearchFilter, RecipeFilter,
+                      RecipeSearchFilter)
+from .mixins import (AnonymousCacheMixin, ConditionalMixin,
+                     RateLimitHeadersMixin)
+from .negotiation import IgnoreFormatContentNegotiation
+from .pagination import LimitOrCursorPagination, LimitPagination
+from .parsers import NDJSONParser, PayloadTooLarge
 from .permissions import IsAuthor, IsReadOnly
 from .serializers import (CreateRecipeSerializer, CustomUserSerializer,
-                          IngredientSerializer, RecipeMinifiedSerializer,
-                          RecipeSerializer, SubscriptionSerializer,
-                          TagSerializer)
+                          IngredientSerializer, RecipeIdsSerializer,
+                          RecipeListSerializer, RecipeMinifiedSerializer,
+                          RecipeSerializer, ShoppingCartTotalSerializer,
+                          SubscriptionSerializer, TagSerializer,
+                          requested_fields)
+from .throttling import TokenBucketThrottle
+
+COUNTER_FIELDS = ('favorites_count', 'in_carts_count')
+DELETE_BATCH_SIZE = 500
+
+
+def lock_recipe_links(user):
+    """Блокирует строку пользователя до конца транзакции.
+
+    Избранное и список покупок одного пользователя меняются по очереди,
+    поэтому прочитанное перед вставкой или удалением не устаревает и
+    счётчики с итогами сдвигаются ровно на изменённые строки.
+    """
+    list(User.objects.select_for_update().filter(pk=user.pk).values('pk'))
+
+
+def delete_recipe_links(model, user, recipe_ids):
+    """Удаляет строки избранного или списка покупок запросами DELETE
+    по DELETE_BATCH_SIZE рецептов, без сигналов и без выборки удаляемых
+    строк: счётчики и итоги обновляет вызывающий код.
+    """
+    using = router.db_for_write(model)
+    for start in range(0, len(recipe_ids), DELETE_BATCH_SIZE):
+        model.objects.filter(
+            user=user, recipe__in=recipe_ids[start:start + DELETE_BATCH_SIZE]
+        )._raw_delete(using)
 
 
-class CustomUserViewSet(UserViewSet):
+def with_requested_related(recipes, request):
+    """Подгружает для рецептов только то, что нужно полям ответа
+    из ?fields= и ?expand=: связанные объекты, флаги пользователя, text.
+    """
+    only, expand = requested_fields(request)
+    if only is None:
+        return recipes.with_related().with_user_flags(request.user)
+    wanted = only | expand
+    recipes = recipes.with_related(
+        author='author' in expand,
+        tags='tags' in wanted,
+        ingredients='ingredients' in expand
+    ).with_user_flags(request.user, [
+        flag for flag, needed in (
+            ('is_favorited', 'is_favorited' in wanted),
+            ('is_in_shopping_cart', 'is_in_shopping_cart' in wanted),
+            ('author_is_subscribed', 'author' in expand),
+        ) if needed
+    ])
+    if 'ingredients' in wanted and 'ingredients' not in expand:
+        recipes = recipes.prefetch_related('ingredients')
+    if 'text' not in wanted:
+        recipes = recipes.defer('text')
+    return recipes
+
+
+class CustomUserViewSet(RateLimitHeadersMixin, UserViewSet):
     serializer_class = CustomUserSerializer
     pagination_class = LimitPagination
+    throttle_scope = None
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        only, _ = requested_fields(self.request)
+        if self.action in ('list', 'retrieve') and (
+                only is None or 'is_subscribed' in only):
+            user = self.request.user
+            if user.is_anonymous:
+                return queryset.annotate(is_subscribed=Value(
+                    False, output_field=BooleanField()
+                ))
+            return queryset.annotate(is_subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef('pk'))
+            ))
+        return queryset
 
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
@@ -32,7 +121,10 @@ class CustomUserViewSet(UserViewSet):
         return super(CustomUserViewSet, self).me(request, *args, **kwargs)
 
     @action(detail=True, methods=['post'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            throttle_classes=[TokenBucketThrottle],
+            throttle_scope='subscribe')
+    @transaction.atomic
     def subscribe(self, request, id=None):
         user = request.user
         author = get_object_or_404(User, id=id)
@@ -52,6 +144,7 @@ class CustomUserViewSet(UserViewSet):
             user=user,
             author=author
         )
+        author.is_subscribed = True
         serializer = SubscriptionSerializer(
             author,
             context={'request': request}
@@ -59,6 +152,7 @@ class CustomUserViewSet(UserViewSet):
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @subscribe.mapping.delete
+    @transaction.atomic
     def delete_subscribe(self, request, id=None):
         author = get_object_or_404(User, id=id)
         subscription = Subscription.objects.filter(
@@ -74,69 +168,262 @@ class CustomUserViewSet(UserViewSet):
         )
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalMixin, AnonymousCacheMixin,
+                        ReadOnlyModelViewSet):
+    cache_generations = ('ingredient',)
+    conditional_generations = ('ingredient',)
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     filter_backends = [IngredientSearchFilter, ]
-    search_fields = ('^name',)
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ConditionalMixin, AnonymousCacheMixin, ReadOnlyModelViewSet):
+    cache_generations = ('tag',)
+    conditional_generations = ('tag',)
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(RateLimitHeadersMixin, ConditionalMixin,
+                    AnonymousCacheMixin, ModelViewSet):
+    cache_generations = ('recipe', 'tag', 'ingredient', 'user')
+    conditional_generations = ('recipe', 'tag', 'ingredient', 'user')
+    conditional_per_viewer = True
     queryset = Recipe.objects.all()
     serializer_class = RecipeSerializer
     permission_classes = [IsAuthor | IsReadOnly]
-    pagination_class = LimitPagination
-    filter_backends = [DjangoFilterBackend, ]
+    pagination_class = LimitOrCursorPagination
+    filter_backends = [DjangoFilterBackend, OrderingFilter, RecipeSearchFilter]
     filter_class = RecipeFilter
+    ordering_fields = ('id', 'favorites_count', 'in_carts_count')
+    ordering = ('-id',)
+    throttle_scope = None
+
+    def get_queryset(self):
+        if self.action in ('list', 'retrieve'):
+            return with_requested_related(Recipe.objects.all(), self.request)
+        return super().get_queryset()
+
+    def described_by_generations(self):
+        """Счётчики меняются без смены поколений, поэтому список,
+        отсортированный по ним, не кэшируется и валидаторов не получает.
+        """
+        if self.action != 'list':
+            return True
+        ordering = OrderingFilter().get_ordering(
+            self.request, self.queryset, self
+        )
+        return not any(
+            field.lstrip('-') in COUNTER_FIELDS for field in ordering
+        )
 
     def get_serializer_class(self):
         if self.request.method == 'GET':
             return RecipeSerializer
         return CreateRecipeSerializer
 
+    @transaction.atomic
     def execution(self, request, pk, attr):
+        lock_recipe_links(request.user)
         instance = attr.objects.filter(user=request.user, recipe__id=pk)
         if request.method == 'POST' and not instance.exists():
             recipe = get_object_or_404(Recipe, id=pk)
             attr.objects.create(user=request.user, recipe=recipe)
-            serializer = RecipeMinifiedSerializer(recipe)
+            serializer = RecipeMinifiedSerializer(
+                recipe, context={'request': request}
+            )
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         elif request.method == 'DELETE' and instance.exists():
             instance.delete()
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    @transaction.atomic
+    def batch_execution(self, request, attr):
+        """Добавляет (POST) или убирает (DELETE) сразу много рецептов.
+
+        Рецепты проверяются одним запросом, добавляются одним INSERT с
+        пропуском уже существующих строк, а удаляются запросом DELETE без
+        сигналов, поэтому счётчики, итоги списка покупок и поколение
+        пользователя обновляются здесь же — только по тем строкам, что
+        изменились под блокировкой lock_recipe_links.
+        """
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data['ids']
+        user = request.user
+        lock_recipe_links(user)
+        if request.method == 'POST':
+            found = dict(Recipe.objects.filter(pk__in=ids).annotate(
+                added=Exists(attr.objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                ))
+            ).values_list('pk', 'added'))
+            changed = [pk for pk in ids if pk in found and not found[pk]]
+            attr.objects.bulk_create(
+                [attr(user=user, recipe_id=pk) for pk in changed],
+                ignore_conflicts=True
+            )
+            delta = 1
+            results = [
+                'not_found' if pk not in found
+                else 'exists' if found[pk] else 'created'
+                for pk in ids
+            ]
+        else:
+            changed = set(attr.objects.filter(
+                user=user, recipe__in=ids
+            ).values_list('recipe_id', flat=True))
+            if changed:
+                delete_recipe_links(attr, user, sorted(changed))
+            delta = -1
+            results = [
+                'deleted' if pk in changed else 'not_found' for pk in ids
+            ]
+        if changed:
+            shift_counters(attr, changed, delta)
+            if attr is ShoppingCart:
+                cart.change_carts(((user.pk, pk) for pk in changed), delta)
+            bump_generation(viewer_generation(user.pk))
+        return Response({'results': [
+            {'id': pk, 'status': result} for pk, result in zip(ids, results)
+        ]})
+
     @action(detail=True, methods=['post', 'delete'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            throttle_classes=[TokenBucketThrottle],
+            throttle_scope='favorite')
     def favorite(self, request, pk=None):
         return self.execution(request, pk, Favorite)
 
+    @action(detail=False, methods=['post', 'delete'], url_path='favorite',
+            url_name='favorite-batch',
+            permission_classes=[IsAuthenticated],
+            throttle_classes=[TokenBucketThrottle],
+            throttle_scope='favorite')
+    def favorite_batch(self, request):
+        return self.batch_execution(request, Favorite)
+
     @action(detail=True, methods=['post', 'delete'],
-            permission_classes=[IsAuthenticated])
+            permission_classes=[IsAuthenticated],
+            throttle_classes=[TokenBucketThrottle],
+            throttle_scope='shopping_cart')
     def shopping_cart(self, request, pk=None):
         return self.execution(request, pk, ShoppingCart)
 
     @action(detail=False, methods=['get'],
             permission_classes=[IsAuthenticated])
+    def feed(self, request):
+        queryset = with_requested_related(
+            feed_queryset(request.user), request
+        )
+        page = self.paginate_queryset(queryset)
+        serializer = RecipeSerializer(
+            page, many=True, context=self.get_serializer_context()
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        recipe = self.get_object()
+        similar = [
+            item.similar for item in SimilarRecipe.objects.filter(
+                recipe=recipe
+            ).select_related('similar')
+        ]
+        serializer = RecipeMinifiedSerializer(
+            similar, many=True, context=self.get_serializer_context()
+        )
+        return Response(serializer.data)
+
+    @action(detail=False, methods=['post'], url_path='import',
+            permission_classes=[IsAuthenticated],
+            parser_classes=[NDJSONParser, JSONParser],
+            throttle_classes=[TokenBucketThrottle],
+            throttle_scope='import')
+    def import_recipes(self, request):
+        """Создаёт рецепты из NDJSON или JSON-списка.
+
+        Рецепты проверяются и сохраняются пачками по batch_size
+        RecipeListSerializer по мере разбора тела запроса, но в одной
+        транзакции: ошибка в любой строке отменяет весь импорт, а ключи
+        ошибок — номера строк, начиная с 1.
+        """
+        length = int(request.META.get('CONTENT_LENGTH') or 0)
+        if length > settings.IMPORT_MAX_BYTES:
+            raise PayloadTooLarge(f'Больше {settings.IMPORT_MAX_BYTES} байт.')
+        rows = request.data
+        if not isinstance(rows, (list, Iterator)):
+            return Response(
+                {'detail': 'Ожидается список рецептов.'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if isinstance(rows, list) and len(rows) > settings.IMPORT_MAX_ROWS:
+            raise PayloadTooLarge(
+                f'Больше {settings.IMPORT_MAX_ROWS} рецептов.'
+            )
+        rows, ids = iter(rows), []
+        with transaction.atomic():
+            while True:
+                batch = list(islice(rows, RecipeListSerializer.batch_size))
+                if not batch:
+                    break
+                serializer = CreateRecipeSerializer(
+                    data=batch,
+                    many=True,
+                    context=self.get_serializer_context()
+                )
+                if not serializer.is_valid():
+                    raise ValidationError({
+                        len(ids) + number: errors
+                        for number, errors in enumerate(
+                            serializer.errors, start=1
+                        )
+                        if errors
+                    })
+                ids.extend(recipe.pk for recipe in serializer.save())
+        return Response(
+            {'created': len(ids), 'ids': ids},
+            status=status.HTTP_201_CREATED
+        )
+
+    @action(detail=False, methods=['get'], url_path='shopping_cart',
+            url_name='shopping-cart-totals',
+            permission_classes=[IsAuthenticated],
+            throttle_classes=[TokenBucketThrottle],
+            throttle_scope='shopping_cart')
+    def shopping_cart_totals(self, request):
+        serializer = ShoppingCartTotalSerializer(
+            ShoppingCartTotal.objects.filter(user=request.user), many=True
+        )
+        return Response(serializer.data)
+
+    @shopping_cart_totals.mapping.post
+    @shopping_cart_totals.mapping.delete
+    def shopping_cart_batch(self, request):
+        return self.batch_execution(request, ShoppingCart)
+
+    @action(detail=False, methods=['get'],
+            permission_classes=[IsAuthenticated],
+            content_negotiation_class=IgnoreFormatContentNegotiation)
     def download_shopping_cart(self, request):
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__shopping_cart__user=request.user
-        ).values(
-            'ingredient__name',
-            'ingredient__measurement_unit'
-        ).annotate(total_amount=Sum('amount'))
-        shopping_list = ['{} ({}) - {}\n'.format(
-            ingredient['ingredient__name'],
-            ingredient['ingredient__measurement_unit'],
-            ingredient['total_amount']
-        ) for ingredient in ingredients]
-        response = HttpResponse(shopping_list, content_type='text/plain')
-        attachment = 'attachment; filename="shopping_list.txt"'
+        file_format = request.query_params.get('format', 'txt')
+        if file_format not in shopping_list.FORMATS:
+            return Response(
+                {'format': 'Допустимые форматы: {}.'.format(
+                    ', '.join(shopping_list.FORMATS)
+                )},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        ingredients = ShoppingCartTotal.objects.filter(
+            user=request.user
+        ).values('name', 'measurement_unit', 'amount')
+        content_type, render = shopping_list.FORMATS[file_format]
+        response = StreamingHttpResponse(
+            render(ingredients.iterator()),
+            content_type=content_type
+        )
+        attachment = f'attachment; filename="shopping_list.{file_format}"'
         response['Content-Disposition'] = attachment
         return response
 
@@ -144,7 +431,27 @@ class RecipeViewSet(ModelViewSet):
 class SubscriptionListView(ListAPIView):
     serializer_class = SubscriptionSerializer
     permission_classes = [IsAuthenticated]
-    pagination_class = LimitPagination
+    pagination_class = LimitOrCursorPagination
 
     def get_queryset(self):
-        return User.objects.filter(subscriptions__user=self.request.user)
+        only, expand = requested_fields(self.request)
+        recipes = Recipe.objects.all()
+        if only is not None and 'recipes' not in expand:
+            recipes = recipes.only('pk', 'author')
+        recipes_limit = self.request.query_params.get('recipes_limit')
+        if recipes_limit:
+            recipes = recipes.filter(id__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('id')[:int(recipes_limit)]
+            ))
+        users = User.objects.filter(
+            subscriptions__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        ).order_by('-id')
+        if only is not None and 'recipes' not in only | expand:
+            return users
+        return users.prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
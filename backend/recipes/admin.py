@@ -1,5 +1,6 @@
 from django.contrib import admin
 
+from . import cart, tasks
 from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                      ShoppingCart, Tag)
 
@@ -14,12 +15,20 @@ class RecipeIngredientInline(admin.TabularInline):
 
 
 class RecipeAdmin(admin.ModelAdmin):
-    list_display = ('id', 'author', 'name', 'count_in_favorites')
+    list_display = ('id', 'author', 'name', 'favorites_count')
     list_filter = ('author', 'name', 'tags')
+    readonly_fields = (
+        'favorites_count', 'in_carts_count', 'created_at', 'updated_at'
+    )
     inlines = (RecipeIngredientInline, )
 
-    def count_in_favorites(self, recipe):
-        return Favorite.objects.filter(recipe=recipe).count()
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if change:
+            cart.rebuild(ShoppingCart.objects.filter(
+                recipe=form.instance
+            ).values('user_id'))
+        tasks.update_similar_recipes.delay([form.instance.pk])
 
 
 admin.site.register(Ingredient, IngredientAdmin)
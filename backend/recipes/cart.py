@@ -0,0 +1,148 @@
+from collections import Counter, defaultdict
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import (Ingredient, RecipeIngredient, ShoppingCart,
+                     ShoppingCartTotal)
+
+UNIT_CONVERSIONS = {
+    'кг': ('г', 1000),
+    'л': ('мл', 1000),
+}
+
+
+def canonical(unit, amount):
+    """Переводит количество в основную единицу: килограммы в граммы,
+    литры в миллилитры; остальные единицы не меняются.
+    """
+    canonical_unit, factor = UNIT_CONVERSIONS.get(
+        unit.strip().lower(), (unit, 1)
+    )
+    return canonical_unit, amount * factor
+
+
+def recipe_amounts(recipe_ids):
+    """{id рецепта: Counter {(название, единица): количество}}."""
+    amounts = defaultdict(Counter)
+    for recipe_id, name, unit, amount in RecipeIngredient.objects.filter(
+        recipe__in=recipe_ids
+    ).values_list(
+        'recipe_id', 'ingredient__name', 'ingredient__measurement_unit',
+        'amount'
+    ).iterator():
+        unit, amount = canonical(unit, amount)
+        amounts[recipe_id][name, unit] += amount
+    return amounts
+
+
+@transaction.atomic
+def apply(changes):
+    """Сдвигает итоги списков покупок.
+
+    changes — словарь {(id пользователя, название, единица): изменение};
+    строки с нулевым итогом удаляются.
+    """
+    changes = {key: delta for key, delta in changes.items() if delta}
+    if not changes:
+        return
+    totals = {
+        (total.user_id, total.name, total.measurement_unit): total
+        for total in ShoppingCartTotal.objects.select_for_update().filter(
+            user__in={user_id for user_id, _, _ in changes},
+            name__in={name for _, name, _ in changes}
+        )
+    }
+    created, changed, removed = [], [], []
+    for (user_id, name, unit), delta in changes.items():
+        total = totals.get((user_id, name, unit))
+        if total is None:
+            if delta > 0:
+                created.append(ShoppingCartTotal(
+                    user_id=user_id, name=name, measurement_unit=unit,
+                    amount=delta
+                ))
+            continue
+        total.amount += delta
+        if total.amount > 0:
+            changed.append(total)
+        else:
+            removed.append(total.pk)
+    if removed:
+        ShoppingCartTotal.objects.filter(pk__in=removed).delete()
+    if changed:
+        ShoppingCartTotal.objects.bulk_update(changed, ['amount'])
+    if created:
+        ShoppingCartTotal.objects.bulk_create(created)
+
+
+def change_carts(items, sign):
+    """Добавляет (sign=1) или убирает (sign=-1) рецепты из итогов.
+
+    items — пары (id пользователя, id рецепта).
+    """
+    items = list(items)
+    amounts = recipe_amounts({recipe_id for _, recipe_id in items})
+    changes = Counter()
+    for user_id, recipe_id in items:
+        for (name, unit), amount in amounts[recipe_id].items():
+            changes[user_id, name, unit] += sign * amount
+    apply(changes)
+
+
+def change_recipe(recipe_id, ingredient_deltas):
+    """Переносит в итоги изменение ингредиентов рецепта у всех, у кого
+    он в списке покупок. ingredient_deltas — {id ингредиента: изменение}.
+    """
+    users = list(ShoppingCart.objects.filter(
+        recipe_id=recipe_id
+    ).values_list('user_id', flat=True))
+    if not users:
+        return
+    deltas = Counter()
+    for ingredient in Ingredient.objects.filter(pk__in=ingredient_deltas):
+        unit, delta = canonical(
+            ingredient.measurement_unit, ingredient_deltas[ingredient.pk]
+        )
+        deltas[ingredient.name, unit] += delta
+    apply({
+        (user_id, name, unit): delta
+        for user_id in users
+        for (name, unit), delta in deltas.items()
+    })
+
+
+@transaction.atomic
+def rebuild(users=None):
+    """Пересчитывает итоги заново по спискам покупок пользователей users
+    (queryset или список id) или всех пользователей.
+    """
+    if users is None:
+        totals = ShoppingCartTotal.objects.all()
+        ingredients = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__isnull=False
+        )
+    else:
+        totals = ShoppingCartTotal.objects.filter(user__in=users)
+        ingredients = RecipeIngredient.objects.filter(
+            recipe__shopping_cart__user__in=users
+        )
+    totals.delete()
+    amounts = Counter()
+    for row in ingredients.values(
+        'recipe__shopping_cart__user',
+        'ingredient__name',
+        'ingredient__measurement_unit'
+    ).annotate(total=Sum('amount')).order_by().iterator():
+        unit, amount = canonical(
+            row['ingredient__measurement_unit'], row['total']
+        )
+        amounts[
+            row['recipe__shopping_cart__user'], row['ingredient__name'], unit
+        ] += amount
+    ShoppingCartTotal.objects.bulk_create(
+        ShoppingCartTotal(
+            user_id=user_id, name=name, measurement_unit=unit, amount=amount
+        )
+        for (user_id, name, unit), amount in amounts.items()
+    )
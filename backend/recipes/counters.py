@@ -0,0 +1,61 @@
+from django.db.models import Count, F, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from users.models import Subscription, User
+
+from .models import Favorite, Recipe, ShoppingCart
+
+COUNTERS = {
+    Favorite: (Recipe, 'favorites_count', 'recipe'),
+    ShoppingCart: (Recipe, 'in_carts_count', 'recipe'),
+    Recipe: (User, 'recipes_count', 'author'),
+    Subscription: (User, 'subscribers_count', 'author'),
+}
+
+
+def shift_counter(source, pk, delta):
+    """Сдвигает счётчик объекта pk, который ведётся по записям source."""
+    model, field, _ = COUNTERS[source]
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def shift_counters(source, pks, delta):
+    """Сдвигает на delta счётчики всех объектов pks одним запросом."""
+    model, field, _ = COUNTERS[source]
+    model.objects.filter(pk__in=pks).update(**{field: F(field) + delta})
+
+
+def change_counter(source, instance, delta):
+    _, _, foreign_key = COUNTERS[source]
+    shift_counter(source, getattr(instance, f'{foreign_key}_id'), delta)
+
+
+def actual_count(source, foreign_key):
+    return Coalesce(
+        Subquery(
+            source.objects.filter(
+                **{foreign_key: OuterRef('pk')}
+            ).order_by().values(foreign_key).annotate(
+                total=Count('pk')
+            ).values('total'),
+            output_field=IntegerField()
+        ),
+        0
+    )
+
+
+def find_drift(source):
+    """Объекты, у которых счётчик разошёлся с реальным числом записей."""
+    model, field, foreign_key = COUNTERS[source]
+    return model.objects.annotate(
+        actual=actual_count(source, foreign_key)
+    ).exclude(**{field: F('actual')}).only('pk', field)
+
+
+def reconcile(source, batch_size=1000):
+    model, field, _ = COUNTERS[source]
+    drifted = []
+    for instance in find_drift(source).iterator():
+        setattr(instance, field, instance.actual)
+        drifted.append(instance)
+    model.objects.bulk_update(drifted, [field], batch_size=batch_size)
+    return len(drifted)
@@ -0,0 +1,147 @@
+from functools import lru_cache
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.db.models import Q
+from users.models import Subscription, User
+
+from .models import FeedEntry, Recipe
+
+
+def pushing_authors(author_ids):
+    """Авторы, чьи рецепты раскладываются по лентам подписчиков.
+
+    Рецепты авторов с числом подписчиков больше FEED_PUSH_MAX_SUBSCRIBERS
+    не копируются в ленты, а подмешиваются при чтении.
+    """
+    return set(User.objects.filter(
+        pk__in=author_ids,
+        subscribers_count__lte=settings.FEED_PUSH_MAX_SUBSCRIBERS
+    ).values_list('pk', flat=True))
+
+
+def fan_out(recipes):
+    """Добавляет новые рецепты в ленты подписчиков их авторов."""
+    by_author = {}
+    for recipe in recipes:
+        by_author.setdefault(recipe.author_id, []).append(recipe.pk)
+    authors = pushing_authors(by_author)
+    if not authors:
+        return
+    entries = (
+        FeedEntry(user_id=user_id, recipe_id=recipe_id, author_id=author_id)
+        for user_id, author_id in Subscription.objects.filter(
+            author__in=authors
+        ).values_list('user_id', 'author_id').iterator()
+        for recipe_id in by_author[author_id]
+    )
+    while True:
+        batch = list(islice(entries, settings.FEED_BATCH_SIZE))
+        if not batch:
+            break
+        FeedEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill(user_id, author_id):
+    """Кладёт в ленту последние рецепты автора и обрезает ленту."""
+    if not pushing_authors([author_id]):
+        return
+    FeedEntry.objects.bulk_create(
+        [
+            FeedEntry(user_id=user_id, recipe_id=recipe_id,
+                      author_id=author_id)
+            for recipe_id in Recipe.objects.filter(
+                author_id=author_id
+            ).order_by('-id').values_list(
+                'id', flat=True
+            )[:settings.FEED_BACKFILL_SIZE]
+        ],
+        ignore_conflicts=True
+    )
+    trim(user_id)
+
+
+def remove(user_id, author_id):
+    FeedEntry.objects.filter(user_id=user_id, author_id=author_id).delete()
+
+
+def trim(user_id):
+    """Оставляет в ленте не больше FEED_MAX_LENGTH последних записей."""
+    cutoff = FeedEntry.objects.filter(user_id=user_id).order_by(
+        '-recipe_id'
+    ).values_list('recipe_id', flat=True)[
+        settings.FEED_MAX_LENGTH:settings.FEED_MAX_LENGTH + 1
+    ]
+    FeedEntry.objects.filter(user_id=user_id, recipe_id__lte=cutoff).delete()
+
+
+def rebuild(users=None):
+    """Собирает заново ленты пользователей users (queryset или список id)
+    или всех пользователей по их текущим подпискам.
+
+    В ленту попадают последние FEED_BACKFILL_SIZE рецептов каждого
+    автора, всего не больше FEED_MAX_LENGTH записей. Записи пишутся
+    пачками по FEED_BATCH_SIZE. Возвращает число записей.
+    """
+    entries = FeedEntry.objects.all()
+    subscriptions = Subscription.objects.filter(
+        author__subscribers_count__lte=settings.FEED_PUSH_MAX_SUBSCRIBERS
+    )
+    if users is not None:
+        entries = entries.filter(user__in=users)
+        subscriptions = subscriptions.filter(user__in=users)
+    entries.delete()
+
+    @lru_cache(maxsize=settings.FEED_BATCH_SIZE)
+    def latest(author_id):
+        return tuple(Recipe.objects.filter(author_id=author_id).order_by(
+            '-id'
+        ).values_list('id', flat=True)[:settings.FEED_BACKFILL_SIZE])
+
+    def feeds():
+        for user_id, rows in groupby(
+            subscriptions.order_by('user_id').values_list(
+                'user_id', 'author_id'
+            ).iterator(),
+            key=lambda row: row[0]
+        ):
+            recipes = sorted(
+                (
+                    (recipe_id, author_id)
+                    for _, author_id in rows
+                    for recipe_id in latest(author_id)
+                ),
+                reverse=True
+            )[:settings.FEED_MAX_LENGTH]
+            for recipe_id, author_id in recipes:
+                yield FeedEntry(
+                    user_id=user_id, recipe_id=recipe_id, author_id=author_id
+                )
+
+    created = 0
+    batches = feeds()
+    while True:
+        batch = list(islice(batches, settings.FEED_BATCH_SIZE))
+        if not batch:
+            return created
+        FeedEntry.objects.bulk_create(batch)
+        created += len(batch)
+
+
+def feed_queryset(user):
+    """Рецепты авторов, на которых подписан user, новые сверху.
+
+    Обычно это один проход по индексу ленты пользователя; рецепты
+    авторов, которые не раскладываются по лентам, добавляются условием
+    по автору.
+    """
+    pulled = list(Subscription.objects.filter(
+        user=user,
+        author__subscribers_count__gt=settings.FEED_PUSH_MAX_SUBSCRIBERS
+    ).values_list('author_id', flat=True))
+    if not pulled:
+        return Recipe.objects.filter(feed_entries__user=user).order_by('-id')
+    return Recipe.objects.filter(
+        Q(id__in=FeedEntry.objects.filter(user=user).values('recipe_id'))
+        | Q(author__in=pulled)
+    ).order_by('-id')
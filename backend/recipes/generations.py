@@ -0,0 +1,34 @@
+import time
+
+from django.core.cache import caches
+from django.db import transaction
+
+CACHE_ALIAS = 'generations'
+
+
+def get_generations(*names):
+    """Текущие поколения данных; меняются при каждой записи в модели."""
+    cache = caches[CACHE_ALIAS]
+    generations = cache.get_many(names)
+    for name in names:
+        if name not in generations:
+            value = time.time()
+            cache.add(name, value, None)
+            generations[name] = cache.get(name, value)
+    return tuple(generations[name] for name in names)
+
+
+def bump_generation(*names):
+    """Сменяет поколения после фиксации текущей транзакции."""
+    def bump():
+        caches[CACHE_ALIAS].set_many(
+            {name: time.time() for name in names}, None
+        )
+    transaction.on_commit(bump)
+
+
+def viewer_generation(user_id):
+    """Поколение того, что видит конкретный пользователь: его избранное,
+    список покупок и подписки.
+    """
+    return f'viewer-{user_id}'
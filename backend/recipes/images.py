@@ -0,0 +1,96 @@
+import logging
+
+from django.conf import settings
+from sorl.thumbnail import get_thumbnail
+
+from .models import Recipe
+
+logger = logging.getLogger(__name__)
+
+
+def variant_field(name, image_format):
+    """Поле рецепта с путём к копии: image_<name> для основного формата,
+    image_<name>_<формат> для остальных.
+    """
+    if image_format == settings.RECIPE_IMAGE_FORMATS[0]:
+        return f'image_{name}'
+    return f'image_{name}_{image_format.lower()}'
+
+
+def variant_fields():
+    return [
+        variant_field(name, image_format)
+        for name in settings.RECIPE_IMAGE_VARIANTS
+        for image_format in settings.RECIPE_IMAGE_FORMATS
+    ]
+
+
+def get_variant(image, name, image_format):
+    """Уменьшенная копия картинки рецепта.
+
+    Если копии ещё нет, sorl-thumbnail создаёт её при первом обращении
+    и запоминает в хранилище, так что следующие вызовы её только находят.
+    """
+    return get_thumbnail(
+        image,
+        settings.RECIPE_IMAGE_VARIANTS[name],
+        crop='center',
+        format=image_format,
+        quality=settings.RECIPE_IMAGE_QUALITY
+    )
+
+
+def generate_variants(image):
+    """Создаёт копии картинки и возвращает пути к ним в хранилище
+    {поле рецепта: путь}; копии, которые создать не удалось, пропускаются.
+    """
+    paths = {}
+    for name in settings.RECIPE_IMAGE_VARIANTS:
+        for image_format in settings.RECIPE_IMAGE_FORMATS:
+            try:
+                paths[variant_field(name, image_format)] = get_variant(
+                    image, name, image_format
+                ).name
+            except Exception:
+                logger.exception(
+                    'Не удалось создать копию %s %s картинки %s',
+                    name, image_format, image
+                )
+    return paths
+
+
+def store_variants(recipe):
+    """Создаёт копии картинки рецепта и записывает пути к ним в рецепт,
+    если картинка за это время не сменилась. Возвращает True, если
+    рецепт обновлён.
+    """
+    paths = generate_variants(recipe.image)
+    for field, path in paths.items():
+        setattr(recipe, field, path)
+    return bool(paths) and bool(Recipe.objects.filter(
+        pk=recipe.pk, image=recipe.image.name
+    ).update(**paths))
+
+
+def variant_url(recipe, name, image_format=None):
+    """Адрес копии картинки рецепта.
+
+    Обычно копии создаёт фоновая задача после сохранения рецепта; если
+    её ещё нет, копии создаются здесь же, при первом обращении. Поколение
+    рецептов при этом не меняется: ответ уже содержит те же адреса, что
+    и все следующие. Если создать копию не удалось, отдаётся исходная
+    картинка, и это видно в журнале.
+    """
+    field = variant_field(
+        name, image_format or settings.RECIPE_IMAGE_FORMATS[0]
+    )
+    if not getattr(recipe, field):
+        store_variants(recipe)
+    path = getattr(recipe, field)
+    if path:
+        return recipe.image.storage.url(path)
+    logger.warning(
+        'Нет копии %s картинки рецепта %s, отдаётся исходная картинка',
+        field, recipe.pk
+    )
+    return recipe.image.url
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from recipes import similarity
+
+
+class Command(BaseCommand):
+    help = 'Rebuild similar recipes lists from ingredient and tag overlap.'
+
+    def handle(self, *args, **options):
+        stored = similarity.build()
+        self.stdout.write(self.style.SUCCESS(
+            f'Сохранено пар похожих рецептов: {stored}'
+        ))
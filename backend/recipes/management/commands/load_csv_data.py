@@ -1,23 +1,176 @@
 import csv
+import json
 import os
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from Foodgram.settings import BASE_DIR
+from recipes.generations import bump_generation
 from recipes.models import Ingredient
 
+DEFAULT_PATH = os.path.join(BASE_DIR, 'recipes', 'data', 'ingredients.csv')
+JSON_CHUNK_SIZE = 64 * 1024
+
+
+class JSONArrayReader:
+    """Выдаёт элементы JSON-массива по одному.
+
+    Файл читается кусками по chunk_size символов, так что в памяти
+    держится только текущий элемент, а не весь массив.
+    """
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, data_file, chunk_size=JSON_CHUNK_SIZE):
+        self.data_file = data_file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+
+    def read_more(self):
+        chunk = self.data_file.read(self.chunk_size)
+        self.buffer += chunk
+        return chunk
+
+    def peek(self):
+        self.buffer = self.buffer.lstrip()
+        while not self.buffer:
+            if not self.read_more():
+                raise ValueError('JSON-массив оборван.')
+            self.buffer = self.buffer.lstrip()
+        return self.buffer[0]
+
+    def expect(self, chars):
+        char = self.peek()
+        if char not in chars:
+            raise ValueError('Ожидался {}, а не «{}».'.format(
+                ' или '.join(f'«{expected}»' for expected in chars), char
+            ))
+        self.buffer = self.buffer[1:]
+        return char
+
+    def take_item(self):
+        self.peek()
+        while True:
+            try:
+                item, end = self.decoder.raw_decode(self.buffer)
+            except ValueError:
+                if not self.read_more():
+                    raise
+                continue
+            # Число могло оборваться на границе куска: «6.» читается как 6.
+            following = self.buffer[end:].lstrip()[:1]
+            if following in (',', ']') or not self.read_more():
+                self.buffer = self.buffer[end:]
+                return item
+
+    def __iter__(self):
+        self.expect('[')
+        if self.peek() == ']':
+            return
+        while True:
+            yield self.take_item()
+            if self.expect(',]') == ']':
+                return
+
+
+def read_json(data_file):
+    for index, item in enumerate(JSONArrayReader(data_file)):
+        if not isinstance(item, dict):
+            raise CommandError(
+                f'Элемент {index} JSON-массива должен быть объектом с '
+                f'полями name и measurement_unit, а не {item!r}.'
+            )
+        yield item.get('name'), item.get('measurement_unit')
+
+
+READERS = {
+    'csv': csv.reader,
+    'json': read_json,
+}
+
 
 class Command(BaseCommand):
-    help = 'Load data from ingredients.csv to DB.'
+    help = 'Load ingredients from a CSV or JSON file to DB.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?', default=DEFAULT_PATH,
+            help='Файл с ингредиентами (по умолчанию ingredients.csv).'
+        )
+        parser.add_argument(
+            '--format', choices=READERS,
+            help='Формат файла; по умолчанию определяется по расширению.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк вставлять одним запросом.'
+        )
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, какие ингредиенты будут добавлены.'
+        )
 
     def handle(self, *args, **options):
-        data_dir = os.path.join(BASE_DIR, 'recipes', 'data')
-        with open(
-                os.path.join(data_dir, 'ingredients.csv'),
-                encoding='utf-8'
-        ) as csv_file:
-            for row in csv.reader(csv_file):
-                name, measurement_unit = row
-                Ingredient.objects.get_or_create(
-                    name=name,
-                    measurement_unit=measurement_unit
+        path = options['path']
+        file_format = options['format'] or os.path.splitext(
+            path
+        )[1].lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(
+                f'Неизвестный формат файла: {file_format or path}.'
+            )
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size должен быть больше 0.')
+        self.verbosity = options['verbosity']
+        try:
+            with open(path, encoding='utf-8') as data_file, \
+                    transaction.atomic():
+                report = self.load(
+                    READERS[file_format](data_file),
+                    options['batch_size'],
+                    options['dry_run']
                 )
+        except (OSError, ValueError, csv.Error) as error:
+            raise CommandError(error)
+        if not options['dry_run'] and report['inserted']:
+            bump_generation('ingredient')
+        self.stdout.write(self.style.SUCCESS(
+            '{}Добавлено: {inserted}, пропущено дубликатов: {skipped}, '
+            'некорректных строк: {invalid}.'.format(
+                'Пробный запуск. ' if options['dry_run'] else '', **report
+            )
+        ))
+
+    def load(self, rows, batch_size, dry_run):
+        seen = set(
+            Ingredient.objects.values_list(
+                'name', 'measurement_unit'
+            ).iterator()
+        )
+        report = {'inserted': 0, 'skipped': 0, 'invalid': 0}
+        batch = []
+        for row in rows:
+            key = tuple(str(value or '').strip() for value in row)
+            if len(key) != 2 or not all(key):
+                report['invalid'] += 1
+                continue
+            if key in seen:
+                report['skipped'] += 1
+                continue
+            seen.add(key)
+            report['inserted'] += 1
+            if dry_run:
+                self.stdout.write('+ {} ({})'.format(*key))
+                continue
+            batch.append(Ingredient(name=key[0], measurement_unit=key[1]))
+            if len(batch) == batch_size:
+                self.write_batch(batch, report)
+                batch = []
+        if batch:
+            self.write_batch(batch, report)
+        return report
+
+    def write_batch(self, batch, report):
+        Ingredient.objects.bulk_create(batch, ignore_conflicts=True)
+        if self.verbosity:
+            self.stdout.write(f'Записано: {report["inserted"]}')
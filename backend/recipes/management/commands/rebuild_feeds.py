@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.feed import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Rebuild subscription feeds from the current subscriptions.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'users', nargs='*', type=int,
+            help='id пользователей; без них собираются все ленты.'
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            created = rebuild(options['users'] or None)
+        self.stdout.write(f'Записей в лентах: {created}')
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from recipes.counters import COUNTERS, find_drift, reconcile
+
+
+class Command(BaseCommand):
+    help = 'Recalculate favorite, cart, recipe and subscriber counters.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Только показать, сколько счётчиков разошлось.'
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Сколько строк обновлять одним запросом.'
+        )
+
+    def handle(self, *args, **options):
+        for source, (model, field, _) in COUNTERS.items():
+            with transaction.atomic():
+                if options['dry_run']:
+                    drifted = find_drift(source).count()
+                else:
+                    drifted = reconcile(source, options['batch_size'])
+            self.stdout.write(
+                f'{model.__name__}.{field}: расхождений {drifted}'
+            )
@@ -0,0 +1,227 @@
+import io
+import random
+from bisect import bisect
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from mixer.backend.django import Mixer
+from PIL import Image
+from recipes import cart, feed, similarity
+from recipes.counters import COUNTERS, reconcile
+from recipes.generations import bump_generation
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from recipes.search import update_search_vectors
+from users.models import Subscription, User
+
+IMAGE_NAME = 'recipes/images/seed.png'
+PASSWORD = 'seed-password'
+TAGS = (
+    ('Завтрак', '#E26C2D', 'breakfast'),
+    ('Обед', '#49B64E', 'lunch'),
+    ('Ужин', '#8775D2', 'dinner'),
+)
+UNITS = ('г', 'кг', 'мл', 'л', 'шт.', 'ст. л.', 'ч. л.', 'по вкусу')
+POPULARITY = 1.1
+
+
+class Command(BaseCommand):
+    help = 'Fill DB with a synthetic dataset for benchmarks.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=5000)
+        parser.add_argument(
+            '--ingredients', type=int, default=2000,
+            help='Сколько ингредиентов должно быть в справочнике.'
+        )
+        parser.add_argument(
+            '--ingredients-per-recipe', type=int, default=8
+        )
+        parser.add_argument(
+            '--favorites', type=int, default=20,
+            help='Среднее число избранных рецептов у пользователя.'
+        )
+        parser.add_argument(
+            '--carts', type=int, default=5,
+            help='Среднее число рецептов в списке покупок.'
+        )
+        parser.add_argument(
+            '--subscriptions', type=int, default=15,
+            help='Среднее число подписок у пользователя.'
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        if options['users'] < 1 or options['batch_size'] < 1:
+            raise CommandError('--users и --batch-size должны быть больше 0.')
+        self.random = random.Random(options['seed'])
+        self.mixer = Mixer(commit=False, locale='ru')
+        self.batch_size = options['batch_size']
+        with transaction.atomic():
+            tags = self.seed_tags()
+            ingredients = self.seed_ingredients(options['ingredients'])
+            users = self.seed_users(options['users'])
+            recipes = self.seed_recipes(
+                options['recipes'], users, tags, ingredients,
+                options['ingredients_per_recipe']
+            )
+            self.seed_links(
+                Subscription, users, 'author', users,
+                options['subscriptions']
+            )
+            self.seed_links(
+                Favorite, users, 'recipe', recipes, options['favorites']
+            )
+            self.seed_links(
+                ShoppingCart, users, 'recipe', recipes, options['carts']
+            )
+            self.reset_sequences()
+            for source in COUNTERS:
+                reconcile(source, self.batch_size)
+            cart.rebuild()
+            similarity.build()
+            feed.fan_out(Recipe.objects.filter(pk__in=recipes).only(
+                'pk', 'author_id'
+            ))
+            update_search_vectors(Recipe.objects.filter(
+                pk__gte=recipes[0] if recipes else 0
+            ))
+            bump_generation('recipe', 'tag', 'ingredient', 'user')
+        self.stdout.write(self.style.SUCCESS(
+            f'Пользователей: {len(users)}, рецептов: {len(recipes)}, '
+            f'ингредиентов в справочнике: {len(ingredients)}. '
+            f'Пароль пользователей: {PASSWORD}'
+        ))
+
+    def next_id(self, model):
+        return (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+
+    def bulk_create(self, model, objects, **kwargs):
+        for start in range(0, len(objects), self.batch_size):
+            model.objects.bulk_create(
+                objects[start:start + self.batch_size], **kwargs
+            )
+
+    def seed_tags(self):
+        for name, color, slug in TAGS:
+            Tag.objects.get_or_create(
+                slug=slug, defaults={'name': name, 'color': color}
+            )
+        return list(Tag.objects.values_list('pk', flat=True))
+
+    def seed_ingredients(self, total):
+        missing = total - Ingredient.objects.count()
+        if missing > 0:
+            first_id = self.next_id(Ingredient)
+            self.bulk_create(Ingredient, [
+                Ingredient(
+                    pk=first_id + index,
+                    name=f'{self.mixer.faker.word()} {first_id + index}',
+                    measurement_unit=self.random.choice(UNITS)
+                ) for index in range(missing)
+            ])
+        return list(Ingredient.objects.values_list('pk', flat=True))
+
+    def seed_users(self, total):
+        first_id = self.next_id(User)
+        password = make_password(PASSWORD)
+        users = self.mixer.cycle(total).blend(
+            User,
+            pk=(first_id + index for index in range(total)),
+            username=(f'seed{first_id + index}' for index in range(total)),
+            email=(
+                f'seed{first_id + index}@example.com'
+                for index in range(total)
+            ),
+            first_name=self.mixer.faker.first_name,
+            last_name=self.mixer.faker.last_name,
+            password=password,
+            is_staff=False,
+            is_superuser=False,
+            is_active=True
+        )
+        self.bulk_create(User, users)
+        return [user.pk for user in users]
+
+    def seed_recipes(self, total, users, tags, ingredients, per_recipe):
+        if not default_storage.exists(IMAGE_NAME):
+            image = io.BytesIO()
+            Image.new('RGB', (640, 480), (226, 108, 45)).save(image, 'PNG')
+            default_storage.save(IMAGE_NAME, ContentFile(image.getvalue()))
+        first_id = self.next_id(Recipe)
+        authors = self.popular(users)
+        recipes = self.mixer.cycle(total).blend(
+            Recipe,
+            pk=(first_id + index for index in range(total)),
+            author_id=(authors() for _ in range(total)),
+            name=self.mixer.faker.sentence,
+            text=self.mixer.faker.text,
+            image=IMAGE_NAME,
+            search_vector=None,
+            cooking_time=lambda: self.random.randint(5, 180)
+        )
+        self.bulk_create(Recipe, recipes)
+        self.bulk_create(Recipe.tags.through, [
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag)
+            for recipe in recipes
+            for tag in self.random.sample(
+                tags, self.random.randint(1, len(tags))
+            )
+        ])
+        per_recipe = min(per_recipe, len(ingredients))
+        self.bulk_create(RecipeIngredient, [
+            RecipeIngredient(
+                recipe_id=recipe.pk,
+                ingredient_id=ingredient,
+                amount=self.random.randint(1, 500)
+            )
+            for recipe in recipes
+            for ingredient in self.random.sample(ingredients, per_recipe)
+        ])
+        return [recipe.pk for recipe in recipes]
+
+    def popular(self, targets):
+        """Выбор из targets с убывающей по закону Ципфа вероятностью,
+        чтобы у немногих авторов и рецептов было большинство подписчиков
+        и добавлений в избранное.
+        """
+        targets = self.random.sample(targets, len(targets))
+        weights = list(accumulate(
+            1 / rank ** POPULARITY for rank in range(1, len(targets) + 1)
+        ))
+        return lambda: targets[
+            bisect(weights, self.random.random() * weights[-1])
+        ]
+
+    def seed_links(self, model, users, target_field, targets, average):
+        if not targets or average < 1:
+            return
+        choose = self.popular(targets)
+        links = []
+        for user in users:
+            chosen = {
+                choose() for _ in range(self.random.randint(0, 2 * average))
+            }
+            chosen.discard(user if model is Subscription else None)
+            links.extend(
+                model(user_id=user, **{f'{target_field}_id': target})
+                for target in chosen
+            )
+        self.bulk_create(model, links, ignore_conflicts=True)
+
+    def reset_sequences(self):
+        statements = connection.ops.sequence_reset_sql(no_style(), [
+            User, Ingredient, Recipe, Recipe.tags.through, RecipeIngredient,
+            Subscription, Favorite, ShoppingCart,
+        ])
+        with connection.cursor() as cursor:
+            for statement in statements:
+                cursor.execute(statement)
@@ -0,0 +1,51 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:02
+
+import json
+
+from django.conf import settings
+from django.db import migrations, models
+
+TASK_NAME = 'recipes.tasks.generate_image_variants'
+
+
+def enqueue_image_variants(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Task = apps.get_model('tasks', 'Task')
+    recipe_ids = Recipe.objects.using(
+        schema_editor.connection.alias
+    ).exclude(image='').values_list('pk', flat=True)
+    Task.objects.using(schema_editor.connection.alias).bulk_create(
+        (
+            Task(
+                name=TASK_NAME,
+                arguments=json.dumps({'args': [pk], 'kwargs': {}}),
+                max_attempts=settings.TASK_MAX_ATTEMPTS
+            )
+            for pk in recipe_ids.iterator()
+        ),
+        batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_recipe_author_index'),
+        ('tasks', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_medium',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Средняя копия картинки'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumb',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Миниатюра картинки'),
+        ),
+        migrations.RunPython(
+            enqueue_image_variants, migrations.RunPython.noop
+        ),
+    ]
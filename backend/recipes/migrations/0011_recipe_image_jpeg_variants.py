@@ -0,0 +1,23 @@
+# Generated by Django 2.2.16 on 2026-10-18 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0010_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_medium_jpeg',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Средняя копия картинки в JPEG'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumb_jpeg',
+            field=models.CharField(blank=True, editable=False, max_length=255, verbose_name='Миниатюра картинки в JPEG'),
+        ),
+    ]
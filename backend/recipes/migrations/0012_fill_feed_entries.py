@@ -0,0 +1,69 @@
+# Generated by Django 2.2.16 on 2026-10-18 19:40
+
+from itertools import groupby, islice
+
+from django.conf import settings
+from django.db import migrations
+
+
+def fill_feeds(apps, schema_editor):
+    """Ленты для подписок, которые были до появления FeedEntry."""
+    alias = schema_editor.connection.alias
+    FeedEntry = apps.get_model('recipes', 'FeedEntry')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    Subscription = apps.get_model('users', 'Subscription')
+    latest = {}
+
+    def recipes_of(author_id):
+        if author_id not in latest:
+            latest[author_id] = list(Recipe.objects.using(alias).filter(
+                author_id=author_id
+            ).order_by('-id').values_list(
+                'id', flat=True
+            )[:settings.FEED_BACKFILL_SIZE])
+        return latest[author_id]
+
+    def entries():
+        for user_id, rows in groupby(
+            Subscription.objects.using(alias).filter(
+                author__subscribers_count__lte=(
+                    settings.FEED_PUSH_MAX_SUBSCRIBERS
+                )
+            ).order_by('user_id').values_list(
+                'user_id', 'author_id'
+            ).iterator(),
+            key=lambda row: row[0]
+        ):
+            recipes = sorted(
+                (
+                    (recipe_id, author_id)
+                    for _, author_id in rows
+                    for recipe_id in recipes_of(author_id)
+                ),
+                reverse=True
+            )[:settings.FEED_MAX_LENGTH]
+            for recipe_id, author_id in recipes:
+                yield FeedEntry(
+                    user_id=user_id, recipe_id=recipe_id, author_id=author_id
+                )
+
+    batches = entries()
+    while True:
+        batch = list(islice(batches, settings.FEED_BATCH_SIZE))
+        if not batch:
+            break
+        FeedEntry.objects.using(alias).bulk_create(
+            batch, ignore_conflicts=True
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0011_recipe_image_jpeg_variants'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(fill_feeds, migrations.RunPython.noop),
+    ]
@@ -1,7 +1,49 @@
 from colorfield.fields import ColorField
+from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVectorField
 from django.core.validators import MinValueValidator
 from django.db import models
-from users.models import User
+from django.utils import timezone
+from users.models import Subscription, User
+
+USER_FLAGS = ('is_favorited', 'is_in_shopping_cart', 'author_is_subscribed')
+
+
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self, author=True, tags=True, ingredients=True):
+        """Подгружает автора, теги и ингредиенты; ненужное можно выключить."""
+        queryset = self.select_related('author') if author else self
+        lookups = ['tags'] if tags else []
+        if ingredients:
+            lookups.append(models.Prefetch(
+                'recipe_ingredients',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ))
+        return queryset.prefetch_related(*lookups)
+
+    def touch(self):
+        """Отмечает рецепты изменёнными, не вызывая save()."""
+        return self.update(updated_at=timezone.now())
+
+    def with_user_flags(self, user, flags=USER_FLAGS):
+        """Флаги рецептов для user; flags — какие из USER_FLAGS нужны."""
+        if user.is_anonymous:
+            false = models.Value(False, output_field=models.BooleanField())
+            return self.annotate(**dict.fromkeys(flags, false))
+        subqueries = {
+            'is_favorited': Favorite.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            ),
+            'is_in_shopping_cart': ShoppingCart.objects.filter(
+                user=user, recipe=models.OuterRef('pk')
+            ),
+            'author_is_subscribed': Subscription.objects.filter(
+                user=user, author=models.OuterRef('author')
+            ),
+        }
+        return self.annotate(**{
+            flag: models.Exists(subqueries[flag]) for flag in flags
+        })
 
 
 class Recipe(models.Model):
@@ -19,6 +61,30 @@ class Recipe(models.Model):
         upload_to='recipes/images/',
         verbose_name='Картинка'
     )
+    image_thumb = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюра картинки'
+    )
+    image_medium = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name='Средняя копия картинки'
+    )
+    image_thumb_jpeg = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name='Миниатюра картинки в JPEG'
+    )
+    image_medium_jpeg = models.CharField(
+        max_length=255,
+        blank=True,
+        editable=False,
+        verbose_name='Средняя копия картинки в JPEG'
+    )
     text = models.TextField(
         verbose_name='Текстовое описание'
     )
@@ -36,11 +102,41 @@ class Recipe(models.Model):
         default=1,
         verbose_name='Время приготовления в минутах'
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        db_index=True,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
+    search_vector = SearchVectorField(
+        null=True,
+        editable=False,
+        verbose_name='Поисковый вектор'
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата публикации'
+    )
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Дата изменения'
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ['-id']
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        indexes = [
+            GinIndex(fields=['search_vector'], name='recipe_search_vector'),
+            models.Index(fields=['author', '-id'], name='recipe_author_id'),
+        ]
 
     def __str__(self):
         return self.name
@@ -187,3 +283,105 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f'{self.user} {self.recipe}'
+
+
+class ShoppingCartTotal(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_cart_totals',
+        verbose_name='Пользователь'
+    )
+    name = models.CharField(
+        max_length=200,
+        verbose_name='Ингредиент'
+    )
+    measurement_unit = models.CharField(
+        max_length=200,
+        verbose_name='Единица измерения'
+    )
+    amount = models.PositiveIntegerField(verbose_name='Количество')
+
+    class Meta:
+        ordering = ['user', 'name', 'measurement_unit']
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'name', 'measurement_unit'],
+                name='unique_shopping_cart_total'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.measurement_unit}) - {self.amount}'
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar',
+        verbose_name='Рецепт'
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='similar_to',
+        verbose_name='Похожий рецепт'
+    )
+    score = models.FloatField(verbose_name='Сходство')
+
+    class Meta:
+        ordering = ['recipe', '-score']
+        verbose_name = 'Похожий рецепт'
+        verbose_name_plural = 'Похожие рецепты'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipe', 'similar'],
+                name='unique_similar_recipe'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.recipe} ~ {self.similar}'
+
+
+class FeedEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed',
+        verbose_name='Подписчик'
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_entries',
+        verbose_name='Рецепт'
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        verbose_name='Автор'
+    )
+
+    class Meta:
+        verbose_name = 'Запись ленты'
+        verbose_name_plural = 'Записи лент'
+        ordering = ['user', '-recipe_id']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='unique_feed_entry'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', 'author'], name='feed_entry_user_author'
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.user} {self.recipe}'
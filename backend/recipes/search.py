@@ -0,0 +1,236 @@
+import heapq
+import re
+import threading
+import unicodedata
+from bisect import bisect_left
+from collections import defaultdict
+from operator import itemgetter
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVector)
+from django.db import DEFAULT_DB_ALIAS, connection, transaction
+from django.db.models import (Case, F, FloatField, OuterRef, Subquery,
+                              TextField, Value, When)
+
+from .generations import get_generations
+
+WORD = re.compile(r'\w+')
+NAME_WEIGHT, INGREDIENTS_WEIGHT, TEXT_WEIGHT = 1.0, 0.4, 0.2
+MAX_FALLBACK_RESULTS = 500
+
+
+def normalize(text):
+    """Приводит строку к виду для поиска: регистр, Unicode, «ё»."""
+    return unicodedata.normalize('NFKC', text).casefold().replace('ё', 'е')
+
+
+class GenerationIndex:
+    """Индекс в памяти процесса, который строится при первом запросе
+    и перестраивается, когда меняется одно из поколений generations.
+
+    Строится всегда по основной базе: реплика может ещё не содержать
+    изменений, из-за которых сменилось поколение, а индекс под новым
+    поколением живёт до следующей записи.
+    """
+
+    generations = ()
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+
+    def _build(self):
+        raise NotImplementedError
+
+    def get_state(self):
+        generations = get_generations(*self.generations)
+        state = self._state
+        if state is None or state['generations'] != generations:
+            with self._lock:
+                state = self._state
+                if state is None or state['generations'] != generations:
+                    state = self._build()
+                    state['generations'] = generations
+                    self._state = state
+        return state
+
+
+class IngredientPrefixIndex(GenerationIndex):
+    """Отсортированный массив ключей для поиска ингредиентов по префиксу.
+
+    Для каждого ингредиента в индекс попадают суффиксы нормализованного
+    названия, начинающиеся с каждого слова, поэтому «сах» находит и
+    «сахар», и «ванильный сахар».
+    """
+
+    generations = ('ingredient',)
+
+    def _build(self):
+        from .models import Ingredient
+
+        ingredients = sorted(
+            Ingredient.objects.using(DEFAULT_DB_ALIAS),
+            key=lambda item: (normalize(item.name), item.measurement_unit)
+        )
+        entries = []
+        for position, ingredient in enumerate(ingredients):
+            name = normalize(ingredient.name)
+            for word in WORD.finditer(name):
+                entries.append((name[word.start():], word.start(), position))
+        entries.sort()
+        return {
+            'keys': [key for key, _, _ in entries],
+            'entries': entries,
+            'ingredients': ingredients,
+        }
+
+    def search(self, query):
+        """Ингредиенты, у которых название или одно из слов начинается
+        с query: сначала точные совпадения, затем совпадения с начала
+        названия, затем с начала других слов.
+        """
+        query = normalize(query).strip()
+        state = self.get_state()
+        keys, entries = state['keys'], state['entries']
+        ranks = {}
+        index = bisect_left(keys, query)
+        while index < len(keys) and keys[index].startswith(query):
+            key, offset, position = entries[index]
+            if offset:
+                rank = 2
+            else:
+                rank = 0 if key == query else 1
+            if rank < ranks.get(position, 3):
+                ranks[position] = rank
+            index += 1
+        ingredients = state['ingredients']
+        return [
+            ingredients[position] for position in sorted(
+                ranks, key=lambda position: (ranks[position], position)
+            )
+        ]
+
+
+class RecipeSearchIndex(GenerationIndex):
+    """Инвертированный индекс рецептов для баз без полнотекстового поиска.
+
+    Слова запроса сравниваются с началом слов названия, ингредиентов
+    и описания; рецепт должен содержать все слова запроса, а вес
+    совпадения зависит от того, где найдено слово.
+    """
+
+    generations = ('recipe', 'ingredient')
+
+    def _build(self):
+        from .models import Recipe, RecipeIngredient
+
+        postings = defaultdict(lambda: defaultdict(float))
+
+        def add(recipe_id, text, weight):
+            for token in WORD.findall(normalize(text)):
+                postings[token][recipe_id] += weight
+
+        recipes = Recipe.objects.using(DEFAULT_DB_ALIAS)
+        for recipe_id, name, text in recipes.values_list(
+            'id', 'name', 'text'
+        ).iterator():
+            add(recipe_id, name, NAME_WEIGHT)
+            add(recipe_id, text, TEXT_WEIGHT)
+        amounts = RecipeIngredient.objects.using(DEFAULT_DB_ALIAS)
+        for recipe_id, name in amounts.values_list(
+            'recipe_id', 'ingredient__name'
+        ).iterator():
+            add(recipe_id, name, INGREDIENTS_WEIGHT)
+        return {'vocabulary': sorted(postings), 'postings': postings}
+
+    def search(self, text):
+        """Словарь {id рецепта: вес} для рецептов, подходящих под text."""
+        terms = WORD.findall(normalize(text))
+        if not terms:
+            return {}
+        state = self.get_state()
+        vocabulary, postings = state['vocabulary'], state['postings']
+        scores = None
+        for term in terms:
+            term_scores = defaultdict(float)
+            index = bisect_left(vocabulary, term)
+            while (index < len(vocabulary)
+                   and vocabulary[index].startswith(term)):
+                for recipe_id, weight in postings[vocabulary[index]].items():
+                    term_scores[recipe_id] += weight
+                index += 1
+            if scores is not None:
+                term_scores = {
+                    recipe_id: scores[recipe_id] + weight
+                    for recipe_id, weight in term_scores.items()
+                    if recipe_id in scores
+                }
+            scores = term_scores
+            if not scores:
+                break
+        return scores
+
+
+ingredient_index = IngredientPrefixIndex()
+recipe_index = RecipeSearchIndex()
+
+
+def uses_search_vector():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    from .models import Ingredient
+
+    config = settings.RECIPE_SEARCH_CONFIG
+    ingredient_names = Subquery(
+        Ingredient.objects.filter(
+            recipe_ingredients__recipe=OuterRef('pk')
+        ).order_by().values('recipe_ingredients__recipe').annotate(
+            names=StringAgg('name', ' ')
+        ).values('names'),
+        output_field=TextField()
+    )
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(ingredient_names, weight='B', config=config)
+        + SearchVector('text', weight='C', config=config)
+    )
+
+
+def update_search_vectors(recipes):
+    """Пересчитывает поисковые векторы рецептов после фиксации транзакции.
+
+    recipes — queryset рецептов; без PostgreSQL ничего не делает, так как
+    запасной индекс сам перестраивается по поколениям.
+    """
+    if uses_search_vector():
+        transaction.on_commit(
+            lambda: recipes.update(search_vector=search_vector())
+        )
+
+
+def search_recipes(queryset, text):
+    """Оставляет рецепты, подходящие под text, и добавляет им search_rank."""
+    if uses_search_vector():
+        query = SearchQuery(text, config=settings.RECIPE_SEARCH_CONFIG)
+        return queryset.annotate(
+            search_rank=SearchRank(F('search_vector'), query)
+        ).filter(search_vector=query)
+    scores = heapq.nlargest(
+        MAX_FALLBACK_RESULTS,
+        recipe_index.search(text).items(),
+        key=itemgetter(1)
+    )
+    if not scores:
+        return queryset.annotate(
+            search_rank=Value(0, output_field=FloatField())
+        ).none()
+    return queryset.filter(pk__in=[pk for pk, _ in scores]).annotate(
+        search_rank=Case(
+            *[When(pk=pk, then=Value(score)) for pk, score in scores],
+            output_field=FloatField()
+        )
+    )
@@ -0,0 +1,171 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete, pre_save)
+from django.dispatch import receiver
+from users.models import Subscription, User
+
+from . import cart, feed, tasks
+from .counters import change_counter
+from .generations import bump_generation, viewer_generation
+from .images import variant_fields
+from .models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                     ShoppingCart, SimilarRecipe, Tag)
+from .search import update_search_vectors
+
+GENERATIONS = {
+    Recipe: 'recipe',
+    RecipeIngredient: 'recipe',
+    Tag: 'tag',
+    Ingredient: 'ingredient',
+    User: 'user',
+}
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver([post_save, post_delete], sender=Tag)
+@receiver([post_save, post_delete], sender=Ingredient)
+@receiver([post_save, post_delete], sender=User)
+def bump_model_generation(sender, update_fields=None, **kwargs):
+    if sender is User and update_fields == frozenset(['last_login']):
+        return
+    bump_generation(GENERATIONS[sender])
+
+
+@receiver([post_save, post_delete], sender=Favorite)
+@receiver([post_save, post_delete], sender=ShoppingCart)
+@receiver([post_save, post_delete], sender=Subscription)
+def bump_viewer_generation(instance, **kwargs):
+    bump_generation(viewer_generation(instance.user_id))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def bump_recipe_tags_generation(instance, action, reverse, pk_set,
+                                **kwargs):
+    if not action.startswith('post_'):
+        return
+    bump_generation('recipe')
+    if action == 'post_clear' or pk_set:
+        if reverse:
+            Recipe.objects.filter(pk__in=pk_set or ()).touch()
+        else:
+            Recipe.objects.filter(pk=instance.pk).touch()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def touch_recipe(instance, **kwargs):
+    Recipe.objects.filter(pk=instance.recipe_id).touch()
+
+
+@receiver(pre_save, sender=Recipe)
+def reset_image_variants(instance, **kwargs):
+    if not instance.image or not instance.image._committed:
+        for field in variant_fields():
+            setattr(instance, field, '')
+
+
+@receiver(post_save, sender=Recipe)
+def generate_image_variants(instance, update_fields=None, **kwargs):
+    if update_fields is not None and 'image' not in update_fields:
+        return
+    if instance.image:
+        tasks.generate_image_variants.delay(instance.pk)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=Subscription)
+def increment_counter(sender, instance, created, **kwargs):
+    if created:
+        change_counter(sender, instance, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_delete, sender=Subscription)
+def decrement_counter(sender, instance, **kwargs):
+    change_counter(sender, instance, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search_vector(instance, update_fields=None, **kwargs):
+    if update_fields is None or {'name', 'text'} & set(update_fields):
+        update_search_vectors(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search_vectors(instance, created, **kwargs):
+    if not created:
+        update_search_vectors(
+            Recipe.objects.filter(recipe_ingredients__ingredient=instance)
+        )
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(instance, created, **kwargs):
+    if created:
+        tasks.fan_out_recipes.delay([instance.pk])
+
+
+@receiver(post_save, sender=Subscription)
+def backfill_feed(instance, created, **kwargs):
+    if created:
+        tasks.backfill_feed.delay(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def remove_from_feed(instance, **kwargs):
+    feed.remove(instance.user_id, instance.author_id)
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_cart_totals(instance, created, **kwargs):
+    if created:
+        cart.change_carts([(instance.user_id, instance.recipe_id)], 1)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def remove_from_cart_totals(instance, **kwargs):
+    cart.change_carts([(instance.user_id, instance.recipe_id)], -1)
+
+
+def rebuild_ingredient_cart_totals(ingredient):
+    users = list(ShoppingCart.objects.filter(
+        recipe__recipe_ingredients__ingredient=ingredient
+    ).values_list('user_id', flat=True).distinct())
+    if users:
+        transaction.on_commit(lambda: cart.rebuild(users))
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_cart_totals(instance, created, **kwargs):
+    if not created:
+        rebuild_ingredient_cart_totals(instance)
+
+
+@receiver(pre_delete, sender=Ingredient)
+def remove_ingredient_cart_totals(instance, **kwargs):
+    rebuild_ingredient_cart_totals(instance)
+
+
+def update_similar_recipes(recipe_ids):
+    if recipe_ids:
+        tasks.update_similar_recipes.delay(sorted(recipe_ids))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def update_tagged_similar_recipes(instance, action, reverse, pk_set,
+                                  **kwargs):
+    if action in ('post_add', 'post_remove'):
+        update_similar_recipes(pk_set if reverse else {instance.pk})
+    elif action == 'post_clear' and not reverse:
+        update_similar_recipes({instance.pk})
+
+
+@receiver(pre_delete, sender=Recipe)
+def update_deleted_similar_recipes(instance, **kwargs):
+    update_similar_recipes(set(SimilarRecipe.objects.filter(
+        similar=instance
+    ).values_list('recipe_id', flat=True)))
@@ -0,0 +1,202 @@
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Min, Q
+from scipy import sparse
+
+from .models import Recipe, RecipeIngredient, SimilarRecipe
+
+
+def normalized(rows, columns, weights, shape):
+    """Разреженная матрица с единичной длиной строк."""
+    matrix = sparse.csr_matrix((weights, (rows, columns)), shape=shape)
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1))).ravel()
+    norms[norms == 0] = 1
+    return sparse.diags(1 / norms) @ matrix
+
+
+class SimilarityMatrix:
+    """Матрицы рецепт × ингредиент (tf-idf) и рецепт × тег.
+
+    Сходство двух рецептов — косинус их строк по ингредиентам плюс
+    SIMILAR_RECIPES_TAG_BOOST, умноженный на косинус по тегам. Теги
+    учитываются только для рецептов с общими ингредиентами.
+
+    recipes ограничивает строки матриц; частоты ингредиентов для idf
+    при этом всё равно считаются по всем рецептам.
+    """
+
+    def __init__(self, recipes=None):
+        partial = recipes is not None
+        amounts = RecipeIngredient.objects.all()
+        recipe_tags = Recipe.tags.through.objects.all()
+        if partial:
+            amounts = amounts.filter(recipe__in=recipes)
+            recipe_tags = recipe_tags.filter(recipe__in=recipes)
+        else:
+            recipes = Recipe.objects.all()
+        self.recipe_ids = np.fromiter(
+            recipes.order_by('pk').values_list('pk', flat=True),
+            dtype=np.int64
+        )
+        rows, ingredients = self.load(amounts.values_list(
+            'recipe_id', 'ingredient_id'
+        ))
+        rows, ingredient_columns = self.positions(rows, ingredients)
+        if partial:
+            total = Recipe.objects.count()
+            frequency = self.frequencies(amounts, ingredients)
+        else:
+            total = len(self.recipe_ids)
+            frequency = np.bincount(ingredient_columns)
+        idf = np.log((1 + total) / (1 + frequency)) + 1
+        self.ingredients = normalized(
+            rows, ingredient_columns, idf[ingredient_columns],
+            (len(self.recipe_ids), len(frequency))
+        )
+        rows, tags = self.load(recipe_tags.values_list('recipe_id', 'tag_id'))
+        rows, tag_columns = self.positions(rows, tags)
+        self.tags = normalized(
+            rows, tag_columns, np.ones(len(rows)),
+            (len(self.recipe_ids), tag_columns.max(initial=-1) + 1)
+        )
+
+    def frequencies(self, amounts, ingredients):
+        """Во скольких рецептах встречаются ингредиенты из amounts,
+        в порядке столбцов матрицы.
+        """
+        counts = dict(RecipeIngredient.objects.filter(
+            ingredient__in=amounts.values('ingredient_id')
+        ).values('ingredient_id').annotate(
+            count=Count('pk')
+        ).values_list('ingredient_id', 'count').order_by())
+        return np.array(
+            [counts[pk] for pk in np.unique(ingredients)], dtype=np.int64
+        )
+
+    def load(self, pairs):
+        pairs = np.array(list(pairs.iterator()), dtype=np.int64).reshape(-1, 2)
+        return pairs[:, 0], pairs[:, 1]
+
+    def positions(self, recipes, values):
+        """Номера строк рецептов и столбцов значений в матрицах."""
+        rows = np.searchsorted(self.recipe_ids, recipes)
+        _, columns = np.unique(values, return_inverse=True)
+        return rows, columns
+
+    def rows(self, recipe_ids):
+        """Строки матриц для рецептов recipe_ids, которые ещё существуют."""
+        return np.intersect1d(
+            self.recipe_ids, np.fromiter(recipe_ids, dtype=np.int64),
+            assume_unique=True, return_indices=True
+        )[1]
+
+    def scores(self, rows):
+        """Ненулевые сходства строк rows со всеми рецептами:
+        массивы (номер в rows, строка соседа, сходство) без самих rows.
+        """
+        products = (self.ingredients[rows] @ self.ingredients.T).tocoo()
+        keep = rows[products.row] != products.col
+        sources, neighbours = products.row[keep], products.col[keep]
+        tags = np.asarray(self.tags[rows[sources]].multiply(
+            self.tags[neighbours]
+        ).sum(axis=1)).ravel()
+        return (
+            sources, neighbours,
+            products.data[keep] + settings.SIMILAR_RECIPES_TAG_BOOST * tags
+        )
+
+    def top(self, rows):
+        """Похожие рецепты для строк rows, не больше
+        SIMILAR_RECIPES_COUNT на рецепт, по убыванию сходства.
+        """
+        limit = settings.SIMILAR_RECIPES_COUNT
+        for start in range(0, len(rows), settings.SIMILAR_RECIPES_BATCH_SIZE):
+            batch = rows[start:start + settings.SIMILAR_RECIPES_BATCH_SIZE]
+            sources, neighbours, scores = self.scores(batch)
+            order = np.lexsort((-scores, sources))
+            sources, neighbours = sources[order], neighbours[order]
+            scores = scores[order]
+            first = np.searchsorted(sources, sources)
+            keep = np.arange(len(sources)) - first < limit
+            for source, neighbour, score in zip(
+                sources[keep], neighbours[keep], scores[keep]
+            ):
+                yield SimilarRecipe(
+                    recipe_id=int(self.recipe_ids[batch[source]]),
+                    similar_id=int(self.recipe_ids[neighbour]),
+                    score=float(score)
+                )
+
+
+def store(matrix, rows):
+    """Заменяет списки похожих рецептов для строк rows."""
+    batch_size = settings.SIMILAR_RECIPES_BATCH_SIZE
+    recipe_ids = [int(pk) for pk in matrix.recipe_ids[rows]]
+    for start in range(0, len(recipe_ids), batch_size):
+        SimilarRecipe.objects.filter(
+            recipe__in=recipe_ids[start:start + batch_size]
+        ).delete()
+    similar = list(matrix.top(rows))
+    for start in range(0, len(similar), batch_size):
+        SimilarRecipe.objects.bulk_create(similar[start:start + batch_size])
+    return len(similar)
+
+
+@transaction.atomic
+def build():
+    """Пересчитывает похожие рецепты для всех рецептов."""
+    matrix = SimilarityMatrix()
+    SimilarRecipe.objects.all().delete()
+    return store(matrix, np.arange(len(matrix.recipe_ids)))
+
+
+def neighbourhood(recipe_ids):
+    """Рецепты recipe_ids и рецепты, у которых есть общие с ними
+    ингредиенты: с остальными сходство у них нулевое.
+    """
+    return Recipe.objects.filter(
+        Q(pk__in=recipe_ids) | Q(pk__in=RecipeIngredient.objects.filter(
+            ingredient__in=RecipeIngredient.objects.filter(
+                recipe__in=recipe_ids
+            ).values('ingredient_id')
+        ).values('recipe_id'))
+    )
+
+
+@transaction.atomic
+def update(recipe_ids):
+    """Пересчитывает похожие рецепты после изменения рецептов recipe_ids.
+
+    Матрицы строятся только по рецептам с общими ингредиентами: сначала
+    для recipe_ids, чтобы найти соседей, в списки которых они попадали
+    или теперь должны попасть, затем для списков, которые меняются.
+    Сходства остальных пар не пересчитываются, хотя idf немного
+    сдвигается; его выравнивает полный пересчёт build_similarity.
+    """
+    recipe_ids = list(recipe_ids)
+    matrix = SimilarityMatrix(neighbourhood(recipe_ids))
+    rows = matrix.rows(recipe_ids)
+    affected = set(SimilarRecipe.objects.filter(
+        similar__in=recipe_ids
+    ).values_list('recipe_id', flat=True))
+    if len(rows):
+        _, neighbours, scores = matrix.scores(rows)
+        thresholds = {
+            recipe_id: (count, lowest)
+            for recipe_id, count, lowest in SimilarRecipe.objects.filter(
+                recipe__in=neighbourhood(recipe_ids)
+            ).values('recipe_id').annotate(
+                count=Count('pk'), lowest=Min('score')
+            ).values_list('recipe_id', 'count', 'lowest').order_by()
+        }
+        for neighbour, score in zip(matrix.recipe_ids[neighbours], scores):
+            count, lowest = thresholds.get(int(neighbour), (0, 0))
+            if count < settings.SIMILAR_RECIPES_COUNT or score > lowest:
+                affected.add(int(neighbour))
+    affected = sorted(affected.union(recipe_ids))
+    batch_size = settings.SIMILAR_RECIPES_BATCH_SIZE
+    for start in range(0, len(affected), batch_size):
+        batch = affected[start:start + batch_size]
+        matrix = SimilarityMatrix(neighbourhood(batch))
+        store(matrix, matrix.rows(batch))
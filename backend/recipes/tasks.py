@@ -0,0 +1,40 @@
+from tasks.decorators import task
+from users.models import Subscription
+
+from . import feed, similarity
+from .generations import bump_generation
+from .images import store_variants
+from .models import Recipe
+
+
+@task
+def generate_image_variants(recipe_id):
+    recipe = Recipe.objects.filter(pk=recipe_id).only('image').first()
+    if recipe is None or not recipe.image:
+        return
+    if store_variants(recipe):
+        bump_generation('recipe')
+
+
+@task
+def generate_recipes_image_variants(recipe_ids):
+    for recipe_id in recipe_ids:
+        generate_image_variants(recipe_id)
+
+
+@task
+def fan_out_recipes(recipe_ids):
+    feed.fan_out(Recipe.objects.filter(pk__in=recipe_ids).only(
+        'pk', 'author_id'
+    ))
+
+
+@task
+def backfill_feed(user_id, author_id):
+    if Subscription.objects.filter(user=user_id, author=author_id).exists():
+        feed.backfill(user_id, author_id)
+
+
+@task
+def update_similar_recipes(recipe_ids):
+    similarity.update(recipe_ids)
@@ -0,0 +1,54 @@
+import json
+from functools import update_wrapper
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import Task
+
+registry = {}
+
+
+class BackgroundTask:
+    """Функция, которую можно вызвать сразу или поставить в очередь."""
+
+    def __init__(self, func, name, max_attempts):
+        update_wrapper(self, func)
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args, **kwargs)
+
+    def delay(self, *args, **kwargs):
+        """Ставит вызов в очередь; аргументы должны сериализоваться в JSON.
+
+        Задача пишется в текущей транзакции, поэтому обработчик увидит
+        её только после фиксации, вместе с данными, которые ей нужны.
+        При TASKS_EAGER вызов выполняется в этом же процессе сразу после
+        фиксации, без очереди.
+        """
+        if settings.TASKS_EAGER:
+            transaction.on_commit(lambda: self.func(*args, **kwargs))
+            return None
+        return Task.objects.create(
+            name=self.name,
+            arguments=json.dumps({'args': args, 'kwargs': kwargs}),
+            max_attempts=self.max_attempts
+        )
+
+
+def task(func=None, *, name=None, max_attempts=None):
+    """Регистрирует функцию как фоновую задачу: @task или @task(...)."""
+
+    def register(func):
+        background = BackgroundTask(
+            func,
+            name or f'{func.__module__}.{func.__name__}',
+            max_attempts or settings.TASK_MAX_ATTEMPTS
+        )
+        registry[background.name] = background
+        return background
+
+    return register if func is None else register(func)
@@ -0,0 +1,30 @@
+import signal
+
+from django.core.management.base import BaseCommand
+from tasks.worker import Worker
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks until stopped with SIGTERM or SIGINT.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads', type=int, default=4,
+            help='Сколько задач выполнять одновременно.'
+        )
+        parser.add_argument(
+            '--poll-interval', type=float, default=1,
+            help='Через сколько секунд снова проверять пустую очередь.'
+        )
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Выполнить готовые задачи и выйти.'
+        )
+
+    def handle(self, *args, **options):
+        worker = Worker(options['threads'], options['poll_interval'])
+        signal.signal(signal.SIGTERM, worker.stop)
+        signal.signal(signal.SIGINT, worker.stop)
+        self.stdout.write(f'Обработчик {worker.name} запущен.')
+        worker.run(options['once'])
+        self.stdout.write('Обработчик остановлен.')
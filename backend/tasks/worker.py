@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+from time import monotonic
+
+from django.conf import settings
+from django.db import DatabaseError, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .decorators import registry
+from .models import Task
+
+logger = logging.getLogger('foodgram.tasks')
+
+
+def retry_delay(attempts):
+    """Пауза перед повтором: удваивается с каждой неудачной попыткой."""
+    return min(
+        settings.TASK_RETRY_DELAY * 2 ** (attempts - 1),
+        settings.TASK_RETRY_MAX_DELAY
+    )
+
+
+class Worker:
+    """Забирает задачи из таблицы Task и выполняет их в пуле потоков.
+
+    Задачи забираются условным UPDATE, поэтому несколько обработчиков
+    не возьмут одну задачу дважды; в PostgreSQL строки, которые уже
+    забирает другой обработчик, пропускаются (SKIP LOCKED). Задача,
+    которая выполняется дольше TASK_RUNNING_TIMEOUT, считается
+    брошенной (обработчик упал) и забирается снова, если попытки ещё
+    не исчерпаны, а иначе помечается невыполненной.
+    """
+
+    def __init__(self, threads=1, poll_interval=1):
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self.name = '{}:{}:{}'.format(
+            socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8]
+        )[-64:]
+        self.stopping = threading.Event()
+        self.purged_at = None
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def abandoned(self, now):
+        return Q(
+            status=Task.RUNNING,
+            started_at__lt=now - timedelta(
+                seconds=settings.TASK_RUNNING_TIMEOUT
+            )
+        )
+
+    def claimable(self, now):
+        return Q(status=Task.PENDING, run_at__lte=now) | (
+            self.abandoned(now) & Q(attempts__lt=F('max_attempts'))
+        )
+
+    def claim(self, limit):
+        now = timezone.now()
+        with transaction.atomic():
+            exhausted = Task.objects.filter(
+                self.abandoned(now), attempts__gte=F('max_attempts')
+            ).update(
+                status=Task.FAILED,
+                error='Обработчик не завершил последнюю попытку за '
+                      f'{settings.TASK_RUNNING_TIMEOUT} с.',
+                finished_at=now
+            )
+            if exhausted:
+                logger.error(
+                    'Брошенных задач без оставшихся попыток: %s', exhausted
+                )
+            ready = Task.objects.filter(self.claimable(now)).order_by('run_at')
+            if connection.features.has_select_for_update_skip_locked:
+                ready = ready.select_for_update(skip_locked=True)
+            ids = list(ready.values_list('pk', flat=True)[:limit])
+            if not ids:
+                return []
+            Task.objects.filter(self.claimable(now), pk__in=ids).update(
+                status=Task.RUNNING,
+                worker=self.name,
+                started_at=now,
+                attempts=F('attempts') + 1
+            )
+        return list(Task.objects.filter(
+            pk__in=ids, status=Task.RUNNING, worker=self.name, started_at=now
+        ))
+
+    def execute(self, task):
+        try:
+            arguments = json.loads(task.arguments)
+            registry[task.name](*arguments['args'], **arguments['kwargs'])
+        except Exception:
+            self.fail(task, traceback.format_exc())
+        else:
+            self.finish(
+                task, status=Task.DONE, error='', finished_at=timezone.now()
+            )
+        finally:
+            connection.close()
+
+    def finish(self, task, **fields):
+        Task.objects.filter(
+            pk=task.pk, worker=self.name, started_at=task.started_at
+        ).update(**fields)
+
+    def fail(self, task, error):
+        logger.error(
+            'Задача %s (%s), попытка %s из %s:\n%s',
+            task.pk, task.name, task.attempts, task.max_attempts, error
+        )
+        now = timezone.now()
+        if task.name in registry and task.attempts < task.max_attempts:
+            self.finish(
+                task, status=Task.PENDING, error=error,
+                run_at=now + timedelta(seconds=retry_delay(task.attempts))
+            )
+        else:
+            self.finish(
+                task, status=Task.FAILED, error=error, finished_at=now
+            )
+
+    def purge(self):
+        """Раз в час удаляет выполненные задачи старше TASK_KEEP_DONE."""
+        if self.purged_at is not None and monotonic() - self.purged_at < 3600:
+            return
+        self.purged_at = monotonic()
+        Task.objects.filter(
+            status=Task.DONE,
+            finished_at__lt=timezone.now() - timedelta(
+                seconds=settings.TASK_KEEP_DONE
+            )
+        ).delete()
+
+    def run(self, once=False):
+        """Выполняет задачи до stop(); с once — пока очередь не опустеет."""
+        running = set()
+        with ThreadPoolExecutor(self.threads) as pool:
+            while not self.stopping.is_set():
+                running = {future for future in running if not future.done()}
+                tasks = []
+                if len(running) < self.threads:
+                    try:
+                        tasks = self.claim(self.threads - len(running))
+                    except DatabaseError:
+                        logger.exception('Не удалось забрать задачи')
+                running.update(
+                    pool.submit(self.execute, task) for task in tasks
+                )
+                if tasks:
+                    continue
+                if once and not running:
+                    break
+                self.purge()
+                if running:
+                    wait(running, self.poll_interval, FIRST_COMPLETED)
+                else:
+                    self.stopping.wait(self.poll_interval)
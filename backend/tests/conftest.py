@@ -0,0 +1,137 @@
+import io
+
+import pytest
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.uploadedfile import SimpleUploadedFile
+from PIL import Image
+from recipes import cart
+from recipes.counters import COUNTERS, find_drift
+from recipes.models import (Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCartTotal, Tag)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    for alias in settings.CACHES:
+        caches[alias].clear()
+
+
+@pytest.fixture(autouse=True)
+def media_root(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path / 'media')
+
+
+def make_user(django_user_model, number):
+    return django_user_model.objects.create_user(
+        username=f'user{number}', email=f'user{number}@example.com',
+        first_name='Имя', last_name='Фамилия', password='Pass-12345'
+    )
+
+
+@pytest.fixture
+def user(django_user_model):
+    return make_user(django_user_model, 1)
+
+
+@pytest.fixture
+def another_user(django_user_model):
+    return make_user(django_user_model, 2)
+
+
+def client_for(user=None, **headers):
+    client = APIClient(**headers)
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION='Token ' + token.key)
+    return client
+
+
+@pytest.fixture
+def make_client(db):
+    return client_for
+
+
+@pytest.fixture
+def api_client():
+    return client_for()
+
+
+@pytest.fixture
+def user_client(user):
+    return client_for(user)
+
+
+@pytest.fixture
+def another_client(another_user):
+    return client_for(another_user)
+
+
+@pytest.fixture
+def tags(db):
+    return [
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast'),
+        Tag.objects.create(name='Обед', color='#49B64E', slug='lunch'),
+    ]
+
+
+@pytest.fixture
+def ingredients(db):
+    return [
+        Ingredient.objects.create(name=name, measurement_unit=unit)
+        for name, unit in (('сахар', 'г'), ('мука', 'г'), ('молоко', 'мл'))
+    ]
+
+
+def image_file(name='recipe.png'):
+    content = io.BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(content, 'PNG')
+    return SimpleUploadedFile(name, content.getvalue(), 'image/png')
+
+
+@pytest.fixture
+def make_recipe(user, tags, ingredients):
+    def make(author=user, name='Блины', amounts=(100, 200)):
+        recipe = Recipe.objects.create(
+            author=author, name=name, text='Описание', cooking_time=10,
+            image=image_file()
+        )
+        recipe.tags.set(tags[:1])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe, ingredient=ingredient, amount=amount
+            )
+            for ingredient, amount in zip(ingredients, amounts)
+        ])
+        return recipe
+    return make
+
+
+@pytest.fixture
+def recipe(make_recipe):
+    return make_recipe()
+
+
+def cart_totals(user):
+    return set(ShoppingCartTotal.objects.filter(user=user).values_list(
+        'name', 'measurement_unit', 'amount'
+    ))
+
+
+@pytest.fixture
+def assert_consistent(db):
+    """Проверяет, что счётчики совпадают с данными, а итоги списка
+    покупок user — с пересчитанными заново; возвращает эти итоги.
+    """
+    def check(user=None):
+        for source in COUNTERS:
+            assert not find_drift(source).exists(), source.__name__
+        if user is None:
+            return None
+        maintained = cart_totals(user)
+        cart.rebuild([user.pk])
+        assert cart_totals(user) == maintained
+        return maintained
+    return check
@@ -0,0 +1,73 @@
+import pytest
+from api import views
+from recipes.models import Favorite, ShoppingCart
+
+
+@pytest.mark.django_db
+class TestBatchEndpoints:
+
+    @pytest.mark.parametrize('action, model', [
+        ('favorite', Favorite),
+        ('shopping_cart', ShoppingCart),
+    ])
+    def test_batch_add_and_remove(self, user, user_client, make_recipe,
+                                  assert_consistent, action, model):
+        first, second, third = (
+            make_recipe(name=f'Рецепт {number}') for number in range(3)
+        )
+        url = f'/api/recipes/{action}/'
+        missing = third.pk + 100
+        user_client.post(f'/api/recipes/{first.pk}/{action}/')
+
+        response = user_client.post(
+            url, {'ids': [first.pk, second.pk, second.pk, missing]},
+            format='json'
+        )
+        assert response.status_code == 200
+        assert response.data['results'] == [
+            {'id': first.pk, 'status': 'exists'},
+            {'id': second.pk, 'status': 'created'},
+            {'id': missing, 'status': 'not_found'},
+        ]
+        assert set(model.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )) == {first.pk, second.pk}
+        assert_consistent(user)
+
+        response = user_client.delete(
+            url, {'ids': [second.pk, third.pk]}, format='json'
+        )
+        assert response.data['results'] == [
+            {'id': second.pk, 'status': 'deleted'},
+            {'id': third.pk, 'status': 'not_found'},
+        ]
+        assert list(model.objects.filter(user=user).values_list(
+            'recipe_id', flat=True
+        )) == [first.pk]
+        assert_consistent(user)
+
+    def test_batch_delete_in_chunks_keeps_other_users(
+        self, user, another_user, user_client, another_client, make_recipe,
+        assert_consistent, monkeypatch
+    ):
+        monkeypatch.setattr(views, 'DELETE_BATCH_SIZE', 1)
+        recipes = [make_recipe(name=f'Рецепт {number}') for number in range(3)]
+        ids = [recipe.pk for recipe in recipes]
+        for client in (user_client, another_client):
+            client.post('/api/recipes/favorite/', {'ids': ids}, format='json')
+        response = user_client.delete(
+            '/api/recipes/favorite/', {'ids': ids}, format='json'
+        )
+        assert [row['status'] for row in response.data['results']] == [
+            'deleted'
+        ] * 3
+        assert not Favorite.objects.filter(user=user).exists()
+        assert Favorite.objects.filter(user=another_user).count() == 3
+        assert_consistent(user)
+
+    def test_batch_rejects_too_many_ids(self, user_client):
+        response = user_client.post(
+            '/api/recipes/favorite/', {'ids': list(range(1, 102))},
+            format='json'
+        )
+        assert response.status_code == 400
@@ -0,0 +1,50 @@
+import pytest
+from recipes.models import Ingredient, RecipeIngredient
+
+
+@pytest.mark.django_db
+class TestShoppingCartTotals:
+
+    def test_totals_follow_cart_changes(self, user, user_client, make_recipe,
+                                        ingredients, assert_consistent):
+        first = make_recipe(amounts=(100, 200))
+        second = make_recipe(name='Оладьи', amounts=(50,))
+        sugar_kg = Ingredient.objects.create(
+            name='сахар', measurement_unit='кг'
+        )
+        RecipeIngredient.objects.create(
+            recipe=second, ingredient=sugar_kg, amount=2
+        )
+        for recipe in (first, second):
+            response = user_client.post(
+                f'/api/recipes/{recipe.pk}/shopping_cart/'
+            )
+            assert response.status_code == 201
+        assert assert_consistent(user) == {
+            ('сахар', 'г', 2150), ('мука', 'г', 200)
+        }
+
+        response = user_client.delete(
+            f'/api/recipes/{first.pk}/shopping_cart/'
+        )
+        assert response.status_code == 204
+        assert assert_consistent(user) == {('сахар', 'г', 2050)}
+
+    def test_totals_follow_recipe_edits(self, user, another_user,
+                                        user_client, another_client,
+                                        make_recipe, ingredients,
+                                        assert_consistent):
+        recipe = make_recipe(author=another_user, amounts=(100, 200))
+        user_client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        response = another_client.patch(
+            f'/api/recipes/{recipe.pk}/',
+            {'ingredients': [
+                {'id': ingredients[0].pk, 'amount': 30},
+                {'id': ingredients[2].pk, 'amount': 500},
+            ]},
+            format='json'
+        )
+        assert response.status_code == 200
+        assert assert_consistent(user) == {
+            ('сахар', 'г', 30), ('молоко', 'мл', 500)
+        }
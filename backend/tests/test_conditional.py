@@ -0,0 +1,57 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+
+def revalidate(client, url, response):
+    return client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+
+@pytest.mark.django_db(transaction=True)
+class TestConditionalRequests:
+
+    def test_unchanged_list_is_not_modified(self, api_client, recipe):
+        url = '/api/recipes/'
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert response.has_header('Last-Modified')
+        with CaptureQueriesContext(connection) as queries:
+            assert revalidate(api_client, url, response).status_code == 304
+        assert not queries.captured_queries
+        response = api_client.get(
+            url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified']
+        )
+        assert response.status_code == 304
+
+    def test_recipe_edit_invalidates(self, api_client, user_client, recipe):
+        url = f'/api/recipes/{recipe.pk}/'
+        response = api_client.get(url)
+        user_client.patch(url, {'name': 'Оладьи'}, format='json')
+        response = revalidate(api_client, url, response)
+        assert response.status_code == 200
+        assert response.data['name'] == 'Оладьи'
+
+    def test_tag_change_invalidates(self, api_client, recipe, tags):
+        response = api_client.get('/api/recipes/')
+        tags[0].name = 'Ужин'
+        tags[0].save()
+        response = revalidate(api_client, '/api/recipes/', response)
+        assert response.status_code == 200
+        assert response.data['results'][0]['tags'][0]['name'] == 'Ужин'
+
+    def test_viewer_changes_invalidate_only_their_validators(
+        self, user_client, another_client, recipe
+    ):
+        url = f'/api/recipes/{recipe.pk}/'
+        mine, theirs = user_client.get(url), another_client.get(url)
+        assert mine['ETag'] != theirs['ETag']
+        user_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        response = revalidate(user_client, url, mine)
+        assert response.status_code == 200
+        assert response.data['is_favorited'] is True
+        assert revalidate(another_client, url, theirs).status_code == 304
+
+    def test_counter_ordering_has_no_validators(self, api_client, recipe):
+        response = api_client.get('/api/recipes/?ordering=-favorites_count')
+        assert response.status_code == 200
+        assert not response.has_header('ETag')
@@ -0,0 +1,72 @@
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from recipes.models import Recipe
+
+
+@pytest.mark.django_db
+class TestCounters:
+
+    @pytest.mark.parametrize('action, field', [
+        ('favorite', 'favorites_count'),
+        ('shopping_cart', 'in_carts_count'),
+    ])
+    def test_recipe_links_shift_counter(self, user_client, another_client,
+                                        recipe, assert_consistent, action,
+                                        field):
+        url = f'/api/recipes/{recipe.pk}/{action}/'
+        assert user_client.post(url).status_code == 201
+        assert another_client.post(url).status_code == 201
+        assert user_client.post(url).status_code == 400
+        recipe.refresh_from_db()
+        assert getattr(recipe, field) == 2
+        assert_consistent()
+
+        assert user_client.delete(url).status_code == 204
+        assert user_client.delete(url).status_code == 400
+        recipe.refresh_from_db()
+        assert getattr(recipe, field) == 1
+        assert_consistent()
+
+    def test_recipes_and_subscribers_counters(self, user, another_user,
+                                              another_client, make_recipe,
+                                              assert_consistent):
+        recipe = make_recipe()
+        make_recipe(name='Оладьи')
+        url = f'/api/users/{user.pk}/subscribe/'
+        assert another_client.post(url).status_code == 201
+        user.refresh_from_db()
+        assert (user.recipes_count, user.subscribers_count) == (2, 1)
+        assert_consistent()
+
+        recipe.delete()
+        assert another_client.delete(url).status_code == 204
+        user.refresh_from_db()
+        assert (user.recipes_count, user.subscribers_count) == (1, 0)
+        assert_consistent()
+
+    def test_reconcile_counters_repairs_drift(self, user_client, recipe,
+                                              assert_consistent):
+        user_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        Recipe.objects.update(favorites_count=5, in_carts_count=3)
+        call_command('reconcile_counters', stdout=StringIO())
+        recipe.refresh_from_db()
+        assert (recipe.favorites_count, recipe.in_carts_count) == (1, 0)
+        assert_consistent()
+
+    def test_anonymous_list_ordered_by_counter_is_not_cached(
+        self, api_client, user_client, make_recipe
+    ):
+        first = make_recipe()
+        second = make_recipe(name='Оладьи')
+        url = '/api/recipes/?ordering=-favorites_count,id'
+
+        def order():
+            response = api_client.get(url)
+            assert response.status_code == 200
+            return [recipe['id'] for recipe in response.data['results']]
+
+        assert order() == [first.pk, second.pk]
+        user_client.post(f'/api/recipes/{second.pk}/favorite/')
+        assert order() == [second.pk, first.pk]
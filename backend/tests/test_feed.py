@@ -0,0 +1,60 @@
+from importlib import import_module
+from types import SimpleNamespace
+
+import pytest
+from django.apps import apps
+from django.core.management import call_command
+from django.db import connection
+from recipes import feed
+from recipes.models import FeedEntry
+from users.models import Subscription
+
+
+def feed_ids(user):
+    return list(FeedEntry.objects.filter(user=user).order_by(
+        '-recipe_id'
+    ).values_list('recipe_id', flat=True))
+
+
+@pytest.mark.django_db
+class TestFeedRebuild:
+
+    def test_rebuild_fills_feeds_of_existing_subscriptions(
+            self, settings, user, another_user, make_recipe):
+        settings.FEED_BACKFILL_SIZE = 2
+        settings.FEED_MAX_LENGTH = 3
+        recipes = [
+            make_recipe(author=another_user, name=f'Рецепт {number}')
+            for number in range(3)
+        ]
+        Subscription.objects.bulk_create([
+            Subscription(user=user, author=another_user),
+        ])
+        FeedEntry.objects.all().delete()
+        assert feed.rebuild() == 2
+        assert feed_ids(user) == [recipe.pk for recipe in recipes[:0:-1]]
+
+    def test_command_rebuilds_only_given_users(
+            self, user, another_user, django_user_model, make_recipe):
+        third = django_user_model.objects.create_user(
+            username='third', email='third@example.com', password='Pass-123'
+        )
+        recipe = make_recipe(author=another_user)
+        Subscription.objects.bulk_create([
+            Subscription(user=user, author=another_user),
+            Subscription(user=third, author=another_user),
+        ])
+        FeedEntry.objects.all().delete()
+        call_command('rebuild_feeds', str(user.pk))
+        assert feed_ids(user) == [recipe.pk]
+        assert feed_ids(third) == []
+
+    def test_migration_fills_feeds(self, user, another_user, make_recipe):
+        recipe = make_recipe(author=another_user)
+        Subscription.objects.bulk_create([
+            Subscription(user=user, author=another_user),
+        ])
+        FeedEntry.objects.all().delete()
+        migration = import_module('recipes.migrations.0012_fill_feed_entries')
+        migration.fill_feeds(apps, SimpleNamespace(connection=connection))
+        assert feed_ids(user) == [recipe.pk]
@@ -0,0 +1,71 @@
+import base64
+import io
+import json
+import logging
+
+import pytest
+from PIL import Image
+from recipes import images
+from recipes.images import variant_fields
+from recipes.models import Recipe
+from tasks.models import Task
+
+
+@pytest.fixture(autouse=True)
+def queued(settings):
+    settings.TASKS_EAGER = False
+
+
+@pytest.mark.django_db
+class TestImageVariants:
+
+    def test_missing_variants_are_generated_on_first_request(
+            self, api_client, recipe):
+        assert not any(getattr(recipe, field) for field in variant_fields())
+        response = api_client.get(f'/api/recipes/{recipe.pk}/')
+        assert response.status_code == 200
+        assert response.data['image_thumb'].endswith('.webp')
+        assert response.data['image_medium'].endswith('.webp')
+        assert response.data['image_thumb_jpeg'].endswith('.jpg')
+        assert response.data['image_medium_jpeg'].endswith('.jpg')
+        recipe.refresh_from_db()
+        assert all(getattr(recipe, field) for field in variant_fields())
+
+    def test_failed_variant_falls_back_to_original_and_is_logged(
+            self, api_client, recipe, monkeypatch, caplog):
+        def broken(*args, **kwargs):
+            raise OSError('нет места')
+
+        monkeypatch.setattr(images, 'get_thumbnail', broken)
+        with caplog.at_level(logging.WARNING, logger=images.__name__):
+            response = api_client.get(f'/api/recipes/{recipe.pk}/')
+        assert response.status_code == 200
+        assert response.data['image_thumb'] == response.data['image']
+        assert 'отдаётся исходная картинка' in caplog.text
+
+
+@pytest.mark.django_db
+def test_import_queues_variants_in_one_task(user_client, tags, ingredients):
+    content = io.BytesIO()
+    Image.new('RGB', (40, 30), 'red').save(content, 'PNG')
+    image = base64.b64encode(content.getvalue()).decode()
+    rows = [
+        json.dumps({
+            'name': f'Рецепт {number}', 'text': 'Описание',
+            'cooking_time': 5, 'tags': [tags[0].pk],
+            'ingredients': [{'id': ingredients[0].pk, 'amount': 10}],
+            'image': f'data:image/png;base64,{image}'
+        })
+        for number in range(3)
+    ]
+    response = user_client.post(
+        '/api/recipes/import/', '\n'.join(rows),
+        content_type='application/x-ndjson'
+    )
+    assert response.status_code == 201, response.data
+    queued_task = Task.objects.get(
+        name='recipes.tasks.generate_recipes_image_variants'
+    )
+    assert sorted(json.loads(queued_task.arguments)['args'][0]) == sorted(
+        Recipe.objects.values_list('pk', flat=True)
+    )
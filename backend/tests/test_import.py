@@ -0,0 +1,86 @@
+import base64
+import io
+import json
+
+import pytest
+from api.serializers import RecipeListSerializer
+from PIL import Image
+from recipes.models import Recipe
+
+URL = '/api/recipes/import/'
+
+
+@pytest.fixture
+def rows(tags, ingredients):
+    content = io.BytesIO()
+    Image.new('RGB', (4, 3), 'red').save(content, 'PNG')
+    image = base64.b64encode(content.getvalue()).decode()
+
+    def make(count, start=0, cooking_time=5):
+        return '\n'.join(
+            json.dumps({
+                'name': f'Рецепт {number}', 'text': 'Описание',
+                'cooking_time': cooking_time, 'tags': [tags[0].pk],
+                'ingredients': [{'id': ingredients[0].pk, 'amount': 10}],
+                'image': f'data:image/png;base64,{image}'
+            })
+            for number in range(start, start + count)
+        )
+    return make
+
+
+def post(client, body):
+    return client.post(URL, body, content_type='application/x-ndjson')
+
+
+@pytest.mark.django_db
+class TestImportRecipes:
+
+    def test_rows_are_saved_in_batches(self, user_client, rows, monkeypatch):
+        monkeypatch.setattr(RecipeListSerializer, 'batch_size', 2)
+        response = post(user_client, rows(5))
+        assert response.status_code == 201
+        assert response.data['created'] == 5
+        assert Recipe.objects.count() == 5
+
+    def test_error_in_later_batch_rolls_back_and_names_the_row(
+        self, user_client, rows, monkeypatch
+    ):
+        monkeypatch.setattr(RecipeListSerializer, 'batch_size', 2)
+        body = rows(3) + '\n' + rows(1, start=3, cooking_time=0)
+        response = post(user_client, body)
+        assert response.status_code == 400
+        assert list(response.json()) == ['4']
+        assert 'cooking_time' in response.json()['4']
+        assert not Recipe.objects.exists()
+
+    def test_too_many_rows(self, settings, user_client, rows):
+        settings.IMPORT_MAX_ROWS = 2
+        assert post(user_client, rows(3)).status_code == 413
+        assert not Recipe.objects.exists()
+
+    def test_too_many_bytes(self, settings, user_client, rows):
+        body = rows(2)
+        settings.IMPORT_MAX_BYTES = len(body.encode()) - 1
+        assert post(user_client, body).status_code == 413
+        settings.IMPORT_MAX_BYTES = len(body.encode())
+        assert post(user_client, body).status_code == 201
+
+    def test_imports_are_throttled(self, settings, user_client, rows):
+        settings.REST_FRAMEWORK = {
+            **settings.REST_FRAMEWORK,
+            'DEFAULT_THROTTLE_RATES': {
+                **settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+                'import': '1/hour',
+            },
+        }
+        assert post(user_client, rows(1)).status_code == 201
+        assert post(user_client, rows(1)).status_code == 429
+
+    def test_json_list_is_limited_too(self, settings, user_client, rows):
+        settings.IMPORT_MAX_ROWS = 1
+        body = '[' + rows(2).replace('\n', ',') + ']'
+        response = user_client.post(
+            URL, body, content_type='application/json'
+        )
+        assert response.status_code == 413
@@ -0,0 +1,61 @@
+import json
+from io import StringIO
+
+import pytest
+from django.core.management import CommandError, call_command
+from recipes.management.commands.load_csv_data import JSONArrayReader
+from recipes.models import Ingredient
+
+ITEMS = [
+    {'name': 'соль', 'measurement_unit': 'г'},
+    {'name': 'молоко "3,2%"', 'measurement_unit': 'мл'},
+    {'name': 'яйца', 'measurement_unit': 'шт'},
+]
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 1024])
+def test_json_array_is_read_in_chunks(chunk_size):
+    data = StringIO(json.dumps(ITEMS, ensure_ascii=False, indent=1))
+    assert list(JSONArrayReader(data, chunk_size)) == ITEMS
+
+
+def test_numbers_are_not_cut_at_chunk_boundary():
+    assert list(JSONArrayReader(StringIO('[12345, 6.5e3]'), 2)) == [
+        12345, 6.5e3
+    ]
+
+
+@pytest.mark.parametrize('text', [
+    '', '{}', '[', '[{"name": "соль"}', '[{}, ]', '[{} {}]', '[{"name": ]',
+])
+def test_broken_json_array_is_rejected(text):
+    with pytest.raises(ValueError):
+        list(JSONArrayReader(StringIO(text), 2))
+
+
+@pytest.mark.django_db
+class TestLoadJSON:
+
+    def load(self, tmp_path, items):
+        path = tmp_path / 'ingredients.json'
+        path.write_text(json.dumps(items, ensure_ascii=False),
+                        encoding='utf-8')
+        call_command('load_csv_data', str(path), stdout=StringIO())
+
+    def test_items_are_loaded(self, tmp_path):
+        self.load(tmp_path, ITEMS + [{'name': 'соль'}])
+        assert set(Ingredient.objects.values_list(
+            'name', 'measurement_unit'
+        )) == {(item['name'], item['measurement_unit']) for item in ITEMS}
+
+    @pytest.mark.parametrize('bad_item', [['соль', 'г'], 'соль', None])
+    def test_non_object_item_names_its_index(self, tmp_path, bad_item):
+        with pytest.raises(CommandError, match='Элемент 1 '):
+            self.load(tmp_path, [ITEMS[0], bad_item])
+        assert not Ingredient.objects.exists()
+
+    def test_broken_json_is_command_error(self, tmp_path):
+        path = tmp_path / 'ingredients.json'
+        path.write_text('[{"name": "соль"', encoding='utf-8')
+        with pytest.raises(CommandError):
+            call_command('load_csv_data', str(path), stdout=StringIO())
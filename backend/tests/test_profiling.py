@@ -0,0 +1,21 @@
+import json
+import logging
+
+import pytest
+
+
+@pytest.mark.django_db
+def test_sampled_request_reports_app_time(settings, make_client, recipe,
+                                          caplog):
+    settings.PROFILING_SAMPLE_RATE = 1
+    with caplog.at_level(logging.INFO, logger='foodgram.profiling'):
+        response = make_client().get('/api/recipes/')
+    timing = dict(
+        metric.split(';', 1)
+        for metric in response['Server-Timing'].split(', ')
+    )
+    assert set(timing) == {'db', 'app', 'render', 'total'}
+    assert 'desc="view without db"' in timing['app']
+    record = json.loads(caplog.records[-1].getMessage())
+    assert {'db_ms', 'app_ms', 'render_ms', 'total_ms'} <= set(record)
+    assert record['queries'] > 0
@@ -0,0 +1,94 @@
+import pytest
+from api.authentication import local_tokens
+from recipes.images import store_variants
+from users.models import Subscription
+
+RECIPE_LIST_QUERIES = 4
+SUBSCRIPTION_LIST_QUERIES = 3
+TRIMMED_RECIPE_LIST_QUERIES = 2
+
+
+@pytest.fixture
+def authors(user, django_user_model, make_recipe):
+    """Три автора по три рецепта с готовыми копиями картинок; user
+    подписан на всех.
+    """
+    authors = [
+        django_user_model.objects.create_user(
+            username=f'author{number}', email=f'author{number}@example.com',
+            password='Pass-12345'
+        )
+        for number in range(3)
+    ]
+    for author in authors:
+        for number in range(3):
+            store_variants(make_recipe(author=author, name=f'Рецепт {number}'))
+    Subscription.objects.bulk_create(
+        Subscription(user=user, author=author) for author in authors
+    )
+    return authors
+
+
+@pytest.fixture
+def warm_client(user_client):
+    """Клиент, чей токен уже в кэше процесса."""
+    assert user_client.get('/api/tags/').status_code == 200
+    return user_client
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('authors')
+class TestQueryCounts:
+
+    @pytest.mark.parametrize('limit', (1, 9))
+    def test_recipe_list_for_anonymous(self, api_client,
+                                       django_assert_num_queries, limit):
+        with django_assert_num_queries(RECIPE_LIST_QUERIES):
+            response = api_client.get('/api/recipes/', {'limit': limit})
+        assert len(response.data['results']) == limit
+
+    @pytest.mark.parametrize('limit', (1, 9))
+    def test_recipe_list_for_user(self, warm_client,
+                                  django_assert_num_queries, limit):
+        with django_assert_num_queries(RECIPE_LIST_QUERIES):
+            response = warm_client.get('/api/recipes/', {'limit': limit})
+        assert len(response.data['results']) == limit
+
+    @pytest.mark.parametrize('limit', (1, 3))
+    def test_subscription_list(self, warm_client, django_assert_num_queries,
+                               limit):
+        with django_assert_num_queries(SUBSCRIPTION_LIST_QUERIES):
+            response = warm_client.get(
+                '/api/users/subscriptions/',
+                {'limit': limit, 'recipes_limit': 2}
+            )
+        assert len(response.data['results']) == limit
+        assert all(
+            len(author['recipes']) == 2 for author in response.data['results']
+        )
+
+    def test_warm_token_costs_no_auth_queries(self, user_client,
+                                              django_assert_num_queries):
+        local_tokens.clear()
+        with django_assert_num_queries(RECIPE_LIST_QUERIES + 1) as cold:
+            user_client.get('/api/recipes/')
+        assert any(
+            'authtoken_token' in query['sql']
+            for query in cold.captured_queries
+        )
+        with django_assert_num_queries(RECIPE_LIST_QUERIES) as warm:
+            user_client.get('/api/recipes/')
+        assert not any(
+            'authtoken_token' in query['sql']
+            for query in warm.captured_queries
+        )
+
+    @pytest.mark.parametrize('client', ('api_client', 'warm_client'))
+    def test_fields_skip_related_queries(self, request, client,
+                                         django_assert_num_queries):
+        client = request.getfixturevalue(client)
+        with django_assert_num_queries(TRIMMED_RECIPE_LIST_QUERIES):
+            response = client.get(
+                '/api/recipes/', {'limit': 9, 'fields': 'id,name'}
+            )
+        assert set(response.data['results'][0]) == {'id', 'name'}
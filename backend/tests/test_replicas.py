@@ -0,0 +1,104 @@
+import sqlite3
+
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from Foodgram import dbrouters
+from Foodgram.middleware import ReplicaMiddleware
+from recipes.models import Favorite, Recipe
+from rest_framework.authtoken.models import Token
+
+REPLICA = 'replica'
+
+pytestmark = pytest.mark.skipif(
+    connections.databases['default']['ENGINE'] != 'django.db.backends.sqlite3',
+    reason='реплика собирается из файла SQLite'
+)
+
+
+@pytest.fixture
+def replica(transactional_db, monkeypatch, tmp_path, recipe, user,
+            another_user):
+    """Реплика — копия основной базы во втором файле SQLite, в которой
+    у рецепта другое название, чтобы было видно, откуда прочитано.
+    """
+    for member in (user, another_user):
+        Token.objects.get_or_create(user=member)
+    name = str(tmp_path / 'replica.sqlite3')
+    primary = connections['default']
+    primary.ensure_connection()
+    copy = sqlite3.connect(name)
+    primary.connection.backup(copy)
+    copy.close()
+    monkeypatch.setitem(connections.databases, REPLICA, {
+        **connections.databases['default'], 'NAME': name, 'TEST': {}
+    })
+    Recipe.objects.using(REPLICA).filter(pk=recipe.pk).update(
+        name='С реплики'
+    )
+    yield connections[REPLICA]
+    connections[REPLICA].close()
+    del connections[REPLICA]
+
+
+def recipe_name(client, recipe):
+    response = client.get(f'/api/recipes/{recipe.pk}/')
+    assert response.status_code == 200
+    return response.data['name']
+
+
+class TestReplicaRouting:
+
+    def test_reads_go_to_replica(self, replica, recipe, user, make_client):
+        assert recipe_name(make_client(), recipe) == 'С реплики'
+        assert recipe_name(make_client(user), recipe) == 'С реплики'
+
+    def test_reads_outside_requests_go_to_primary(self, replica, recipe):
+        assert Recipe.objects.get(pk=recipe.pk).name == 'Блины'
+
+    def test_writes_go_to_primary(self, replica, recipe, user,
+                                  make_client):
+        response = make_client(user).post(
+            f'/api/recipes/{recipe.pk}/favorite/'
+        )
+        assert response.status_code == 201
+        assert Favorite.objects.using('default').filter(
+            user=user, recipe=recipe
+        ).exists()
+        assert not Favorite.objects.using(REPLICA).exists()
+
+    def test_reads_after_write_stick_to_primary(self, replica, recipe, user,
+                                                another_user, make_client):
+        client = make_client(user, HTTP_X_REAL_IP='10.0.0.1')
+        client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        assert recipe_name(client, recipe) == 'Блины'
+        other = make_client(another_user, HTTP_X_REAL_IP='10.0.0.1')
+        assert recipe_name(other, recipe) == 'С реплики'
+
+    def test_anonymous_writers_are_told_apart_by_proxy_header(
+        self, replica, recipe, make_client
+    ):
+        writer = make_client(HTTP_X_REAL_IP='10.0.0.1')
+        writer.post('/api/users/', {'username': 'x'})
+        reader = make_client(HTTP_X_REAL_IP='10.0.0.2')
+        assert recipe_name(reader, recipe) == 'С реплики'
+        assert recipe_name(writer, recipe) == 'Блины'
+
+    def test_sign_in_sticks_the_address_for_the_new_token(
+        self, replica, recipe, user, make_client
+    ):
+        dbrouters.mark_sticky(
+            make_client(HTTP_X_REAL_IP='10.0.0.3').get('/').wsgi_request
+        )
+        client = make_client(user, HTTP_X_REAL_IP='10.0.0.3')
+        assert recipe_name(client, recipe) == 'Блины'
+
+    def test_process_local_sticky_cache_is_refused(self, replica, settings):
+        settings.CACHES = {
+            **settings.CACHES,
+            dbrouters.STICKY_CACHE_ALIAS: {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'
+            },
+        }
+        with pytest.raises(ImproperlyConfigured):
+            ReplicaMiddleware(lambda request: None)
@@ -0,0 +1,68 @@
+import os
+
+import pytest
+from api.pdf import MARGIN, PAGE_WIDTH, StreamingPDF, load_font, wrap
+from django.conf import settings
+
+needs_font = pytest.mark.skipif(
+    not os.path.isfile(settings.SHOPPING_LIST_FONT),
+    reason='нет шрифта для списка покупок'
+)
+
+
+@pytest.mark.django_db
+class TestDownloadShoppingCart:
+
+    @pytest.mark.parametrize('file_format, expected', (
+        ('txt', 'сахар (г) - 100'),
+        ('csv', 'сахар,г,100'),
+    ))
+    def test_text_formats(self, user_client, recipe, file_format, expected):
+        user_client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        response = user_client.get(
+            '/api/recipes/download_shopping_cart/', {'format': file_format}
+        )
+        assert response.status_code == 200
+        assert expected in b''.join(response.streaming_content).decode()
+
+    @needs_font
+    def test_pdf_embeds_only_used_glyphs(self, user_client, recipe):
+        user_client.post(f'/api/recipes/{recipe.pk}/shopping_cart/')
+        response = user_client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'pdf'}
+        )
+        assert response.status_code == 200
+        assert response['Content-Type'] == 'application/pdf'
+        content = b''.join(response.streaming_content)
+        assert content.startswith(b'%PDF-1.4')
+        assert content.endswith(b'%%EOF\n')
+        assert b'/FontFile2' in content
+        assert len(content) < os.path.getsize(settings.SHOPPING_LIST_FONT) / 10
+
+    def test_unknown_format(self, user_client):
+        response = user_client.get(
+            '/api/recipes/download_shopping_cart/', {'format': 'docx'}
+        )
+        assert response.status_code == 400
+
+
+@needs_font
+class TestStreamingPDF:
+
+    def test_long_lines_are_wrapped(self):
+        font = load_font(settings.SHOPPING_LIST_FONT)
+        width = PAGE_WIDTH - 2 * MARGIN
+        rows = wrap(font, 'мука пшеничная высшего сорта ' * 10, width)
+        assert len(rows) > 1
+        assert rows[0][0] == 0 and all(indent for indent, _ in rows[1:])
+        assert all(font.width(text, 12) <= width for _, text in rows)
+
+    def test_pages_are_streamed_one_by_one(self):
+        pdf = StreamingPDF(load_font(settings.SHOPPING_LIST_FONT))
+        chunks = pdf.render(f'Ингредиент {number}' for number in range(200))
+        for _ in chunks:
+            if pdf.page_numbers:
+                break
+        assert len(pdf.page_numbers) == 1
+        content = b''.join(chunks)
+        assert content.count(b'/Type /Page ') == 5
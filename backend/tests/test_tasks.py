@@ -0,0 +1,114 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+from tasks.decorators import task
+from tasks.models import Task
+from tasks.worker import Worker, retry_delay
+
+calls = []
+
+
+@task(name='tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task(name='tests.broken', max_attempts=2)
+def broken():
+    raise ValueError('сломано')
+
+
+@pytest.fixture(autouse=True)
+def queued(settings):
+    settings.TASKS_EAGER = False
+    settings.TASK_RETRY_DELAY = 10
+    calls.clear()
+
+
+def run_claimed(worker):
+    claimed = worker.claim(10)
+    for claimed_task in claimed:
+        worker.execute(claimed_task)
+    return claimed
+
+
+@pytest.mark.django_db(transaction=True)
+class TestWorker:
+
+    def test_task_runs_once_and_is_done(self):
+        queued_task = record.delay(5)
+        worker = Worker()
+        assert len(run_claimed(worker)) == 1
+        assert run_claimed(worker) == []
+        queued_task.refresh_from_db()
+        assert calls == [5]
+        assert queued_task.status == Task.DONE
+        assert queued_task.attempts == 1
+        assert queued_task.finished_at is not None
+
+    def test_failed_task_is_retried_with_backoff(self):
+        queued_task = broken.delay()
+        worker = Worker()
+        before = timezone.now()
+        run_claimed(worker)
+        queued_task.refresh_from_db()
+        assert queued_task.status == Task.PENDING
+        assert queued_task.attempts == 1
+        assert 'ValueError' in queued_task.error
+        assert queued_task.run_at >= before + timedelta(seconds=10)
+        assert run_claimed(worker) == []
+
+        Task.objects.update(run_at=timezone.now())
+        run_claimed(worker)
+        queued_task.refresh_from_db()
+        assert queued_task.status == Task.FAILED
+        assert queued_task.attempts == 2
+        assert queued_task.finished_at is not None
+
+    def test_abandoned_running_task_is_claimed_again(self, settings):
+        queued_task = record.delay(1)
+        Task.objects.update(
+            status=Task.RUNNING, worker='gone', started_at=timezone.now()
+            - timedelta(seconds=settings.TASK_RUNNING_TIMEOUT + 1)
+        )
+        run_claimed(Worker())
+        queued_task.refresh_from_db()
+        assert queued_task.status == Task.DONE
+        assert calls == [1]
+
+    def test_abandoned_task_without_attempts_left_fails(self, settings):
+        queued_task = broken.delay()
+        Task.objects.update(
+            status=Task.RUNNING, worker='gone', attempts=2,
+            started_at=timezone.now()
+            - timedelta(seconds=settings.TASK_RUNNING_TIMEOUT + 1)
+        )
+        assert run_claimed(Worker()) == []
+        queued_task.refresh_from_db()
+        assert queued_task.status == Task.FAILED
+        assert queued_task.attempts == 2
+        assert queued_task.finished_at is not None
+        assert str(settings.TASK_RUNNING_TIMEOUT) in queued_task.error
+
+    def test_purge_removes_only_old_done_tasks(self, settings):
+        old, recent = record.delay(1), record.delay(2)
+        retried = broken.delay()
+        worker = Worker()
+        run_claimed(worker)
+        Task.objects.filter(pk__in=[old.pk, retried.pk]).update(
+            finished_at=timezone.now()
+            - timedelta(seconds=settings.TASK_KEEP_DONE + 1)
+        )
+        worker.purge()
+        assert set(Task.objects.values_list('pk', flat=True)) == {
+            recent.pk, retried.pk
+        }
+
+
+def test_retry_delay_doubles_up_to_the_limit(settings):
+    settings.TASK_RETRY_DELAY = 10
+    settings.TASK_RETRY_MAX_DELAY = 60
+    assert [retry_delay(attempt) for attempt in range(1, 6)] == [
+        10, 20, 40, 60, 60
+    ]
@@ -0,0 +1,52 @@
+import pytest
+from api import throttling
+from django.core.cache import caches
+
+
+@pytest.fixture
+def favorite_rate(settings):
+    settings.REST_FRAMEWORK = {
+        **settings.REST_FRAMEWORK,
+        'DEFAULT_THROTTLE_RATES': {
+            **settings.REST_FRAMEWORK['DEFAULT_THROTTLE_RATES'],
+            'favorite': '2/min',
+        },
+    }
+
+
+@pytest.mark.django_db
+@pytest.mark.usefixtures('favorite_rate')
+class TestTokenBucketThrottle:
+
+    def test_empty_bucket_returns_429_with_retry_after(self, user_client,
+                                                       recipe):
+        url = f'/api/recipes/{recipe.pk}/favorite/'
+        response = user_client.post(url)
+        assert response.status_code == 201
+        assert response['X-RateLimit-Limit'] == '2'
+        assert response['X-RateLimit-Remaining'] == '1'
+        assert user_client.delete(url).status_code == 204
+
+        response = user_client.post(url)
+        assert response.status_code == 429
+        assert 1 <= int(response['Retry-After']) <= 30
+        assert response['X-RateLimit-Remaining'] == '0'
+
+    def test_buckets_are_per_user_and_skip_reads(self, user_client,
+                                                 another_client, recipe):
+        url = f'/api/recipes/{recipe.pk}/favorite/'
+        for method in ('post', 'delete', 'post'):
+            getattr(user_client, method)(url)
+        assert user_client.get(f'/api/recipes/{recipe.pk}/').status_code == 200
+        assert another_client.post(url).status_code == 201
+
+    def test_held_lock_delays_but_does_not_refuse(
+        self, user, user_client, recipe, monkeypatch
+    ):
+        monkeypatch.setattr(throttling, 'LOCK_WAIT', 0.01)
+        lock = f'throttle:favorite:user:{user.pk}:lock'
+        caches[throttling.CACHE_ALIAS].add(lock, 1, 60)
+        response = user_client.post(f'/api/recipes/{recipe.pk}/favorite/')
+        assert response.status_code == 201
+        assert response['X-RateLimit-Remaining'] == '1'
+        assert caches[throttling.CACHE_ALIAS].get(lock) == 1